@@ -0,0 +1,5 @@
+# Módulos compartilhados pelas páginas do painel da pesquisa COFECI
+import os
+
+# Diretório raiz do projeto, onde ficam os arquivos da pesquisa
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
@@ -0,0 +1,279 @@
+import glob
+import hmac
+import os
+import runpy
+
+import streamlit as st
+
+from painel import RAIZ
+from painel.instrumentacao import etapa, iniciar_medicao, registrar_medicao
+
+# Os módulos de dados e gráficos (numpy, pyarrow, Plotly, cubo e índices) são importados
+# dentro das funções, depois da senha: a tela de login e as reexecuções sem senha
+# não pagam essa importação nem a carga dos dados.
+
+# Opções fixas da barra lateral
+OPCOES_REGIAO = ['Selecione uma opção', 'Brasil', 'Centro-Oeste', 'Nordeste', 'Norte', 'Sudeste', 'Sul']
+OPCOES_CAPITAL = ['Ambos', 'Capital', 'Interior']
+OPCOES_IDADE = ['Todos', 'Menos de 35 anos', 'Mais de 35 anos']
+OPCOES_SEXO = ['Masculino', 'Feminino']
+
+# Valores iniciais do estado dos filtros, compartilhado por todas as páginas da sessão
+FILTROS_INICIAIS = {
+    'selected_regiao': 'Selecione uma opção',
+    'selected_estado': [],
+    'selected_perg_7': 'Ambos',
+    'selected_idade': 'Todos',
+    'selected_escolaridade': 'Todos',
+    'selected_sexo': OPCOES_SEXO,
+    'ponderar': False,
+}
+
+# Registro das páginas: nome da página -> descrições dos gráficos, na ordem de exibição
+PAGINAS = {}
+
+# Quando verdadeiro, pagina() só registra os gráficos, sem desenhar nada (ver registrar_paginas)
+_somente_registrar = False
+
+
+# Função para verificar a senha (a senha de administrador, se configurada, também
+# libera o painel de instrumentação)
+def check_password():
+    def password_entered():
+        admin_password = st.secrets.get("admin_password")
+        if admin_password and hmac.compare_digest(st.session_state["password"], admin_password):
+            st.session_state["password_correct"] = True
+            st.session_state["admin"] = True
+            del st.session_state["password"]
+        elif hmac.compare_digest(st.session_state["password"], st.secrets["password"]):
+            st.session_state["password_correct"] = True
+            del st.session_state["password"]
+        else:
+            st.session_state["password_correct"] = False
+
+    if st.session_state.get("password_correct", False):
+        return True
+
+    password = st.text_input("Senha: ", type="password", key="password")
+    st.button("Enviar Senha", on_click=password_entered)
+
+    if "password_correct" in st.session_state:
+        st.error("Senha Incorreta.")
+
+    return False
+
+
+# Função para exibir os logos do Cofeci e do Rei no topo da página
+def cabecalho():
+    col1, col_empty, col2 = st.columns([1, 2, 1])
+    with col1:
+        st.image(os.path.join(RAIZ, 'cofeci3.jpeg'), width=100)
+    with col2:
+        st.image(os.path.join(RAIZ, '125.1_LOGO REI-01.png'), width=100)
+
+
+# Função para desenhar os filtros da barra lateral e devolver o recorte filtrado,
+# somente leitura, com as `colunas` da página (None enquanto a seleção estiver incompleta)
+def filtrar_dados(colunas=None):
+    from painel.filtros import REGIOES_ESTADOS, indice_filtros
+    from painel.pesos import pesos_amostrais
+
+    with etapa('carga') as medida:
+        indice = indice_filtros()
+        if medida is not None:
+            medida.linhas = indice.linhas
+
+    for chave, valor in FILTROS_INICIAIS.items():
+        if chave not in st.session_state:
+            st.session_state[chave] = valor
+
+    # Filtro por Região do Brasil; a seleção anterior serve para detectar mudanças
+    previous_regiao = st.session_state['selected_regiao']
+    with etapa('filtro: região'):
+        selected_regiao = st.sidebar.selectbox(
+            'Selecione a Região:',
+            OPCOES_REGIAO,
+            index=OPCOES_REGIAO.index(st.session_state['selected_regiao'])
+        )
+        st.session_state['selected_regiao'] = selected_regiao
+
+    if selected_regiao == 'Selecione uma opção':
+        st.write("Selecione os filtros para visualizar os dados.")
+        return None
+
+    # Opções de estado com base na região selecionada
+    with etapa('filtro: estado') as medida:
+        if selected_regiao == 'Brasil':
+            estados_opcoes = sorted(indice.valores('estado'))
+        else:
+            estados_opcoes = REGIOES_ESTADOS[selected_regiao]
+
+        # Se a região mudou, todos os estados da nova região ficam selecionados
+        if selected_regiao != previous_regiao:
+            st.session_state['selected_estado'] = estados_opcoes
+
+        selected_estado = st.sidebar.multiselect(
+            'Selecione o Estado:',
+            estados_opcoes,
+            default=st.session_state['selected_estado']
+        )
+        if selected_estado:
+            st.session_state['selected_estado'] = selected_estado
+
+        if not st.session_state['selected_estado']:
+            return None
+        selecao = indice.bits('estado', st.session_state['selected_estado'])
+        _anotar_linhas(medida, indice, selecao)
+
+    # Filtro de interior/capital
+    with etapa('filtro: capital') as medida:
+        selected_perg_7 = st.sidebar.radio(
+            "Selecione Interior ou Capital:",
+            options=OPCOES_CAPITAL,
+            index=OPCOES_CAPITAL.index(st.session_state['selected_perg_7'])
+        )
+        st.session_state['selected_perg_7'] = selected_perg_7
+        if selected_perg_7 != 'Ambos':
+            selecao &= indice.bits('capital', [selected_perg_7])
+        _anotar_linhas(medida, indice, selecao)
+
+    # Filtro de idade
+    with etapa('filtro: idade') as medida:
+        selected_idade = st.sidebar.selectbox(
+            "Selecione a Faixa Etária:",
+            options=OPCOES_IDADE,
+            index=OPCOES_IDADE.index(st.session_state['selected_idade'])
+        )
+        st.session_state['selected_idade'] = selected_idade
+        if selected_idade != 'Todos':
+            selecao &= indice.bits('idade', [selected_idade])
+        _anotar_linhas(medida, indice, selecao)
+
+    # Filtro de escolaridade, só com as opções presentes no recorte atual
+    with etapa('filtro: escolaridade') as medida:
+        escolaridade_opcoes = sorted(indice.valores('escolaridade', selecao))
+        if not set(st.session_state['selected_escolaridade']).issubset(set(escolaridade_opcoes)):
+            st.session_state['selected_escolaridade'] = escolaridade_opcoes
+
+        selected_escolaridade = st.sidebar.multiselect(
+            "Selecione a Escolaridade:",
+            escolaridade_opcoes,
+            default=st.session_state['selected_escolaridade']
+        )
+        st.session_state['selected_escolaridade'] = selected_escolaridade
+        if selected_escolaridade:
+            selecao &= indice.bits('escolaridade', selected_escolaridade)
+        _anotar_linhas(medida, indice, selecao)
+
+    # Filtro de sexo; sem nenhuma opção marcada não há o que exibir
+    with etapa('filtro: sexo') as medida:
+        selected_sexo = st.sidebar.multiselect(
+            "Selecione o Sexo dos Entrevistados:",
+            options=OPCOES_SEXO,
+            default=st.session_state['selected_sexo']
+        )
+        st.session_state['selected_sexo'] = selected_sexo
+        if not selected_sexo:
+            return None
+        selecao &= indice.bits('sexo', selected_sexo)
+        _anotar_linhas(medida, indice, selecao)
+
+    # Percentuais ponderados pelos totais do cadastro, só quando há metas de pesos
+    with etapa('pesos'):
+        pesos = pesos_amostrais()
+        if pesos is None:
+            st.session_state['ponderar'] = False
+        else:
+            st.session_state['ponderar'] = st.sidebar.checkbox(
+                "Ponderar pelos totais do cadastro",
+                value=st.session_state['ponderar'],
+                help="Corrige a diferença entre a amostra e o cadastro do COFECI por estado, sexo e idade."
+            )
+            if st.session_state['ponderar']:
+                st.sidebar.caption(f"Efeito do desenho da ponderação: {pesos.efeito_desenho:.2f}")
+
+    with etapa('recorte') as medida:
+        recorte = recortar(st.session_state, colunas)
+        if medida is not None:
+            medida.linhas = len(recorte)
+    return recorte
+
+
+# Anota na etapa medida quantas linhas continuam selecionadas (só com a instrumentação ligada)
+def _anotar_linhas(medida, indice, selecao):
+    if medida is not None:
+        medida.linhas = indice.contar(selecao)
+
+
+# Função para montar o recorte a partir dos filtros escolhidos (mesmas chaves da sessão):
+# só as posições das linhas e as células do cubo que correspondem a ele, sobre as
+# `colunas` pedidas da pesquisa (todas, por padrão)
+def recortar(filtros, colunas=None):
+    from painel.cubo import celulas_selecionadas, selecoes_filtros
+    from painel.dados import carregar_pesquisa
+    from painel.filtros import indice_filtros
+    from painel.pesos import pesos_amostrais
+    from painel.recorte import Recorte
+
+    indice = indice_filtros()
+    selecao = indice.todos()
+    for dimensao, valores in selecoes_filtros(filtros).items():
+        selecao &= indice.bits(dimensao, valores)
+    pesos = pesos_amostrais() if filtros.get('ponderar') else None
+    return Recorte.da_mascara(carregar_pesquisa(colunas), indice.mascara(selecao), celulas_selecionadas(filtros),
+                              pesos)
+
+
+# Função que registra uma página com seus gráficos e a exibe: senha, logos e
+# filtros ficam aqui, a página só descreve os gráficos (ver painel.graficos)
+def pagina(nome, graficos):
+    PAGINAS[nome] = list(graficos)
+    if _somente_registrar:
+        return
+
+    medicao = iniciar_medicao(nome)
+    with etapa('senha'):
+        autenticado = check_password()
+    if not autenticado:
+        st.stop()
+
+    from painel.atualizacao import iniciar_observador
+    from painel.dados import fixar_pesquisa
+    from painel.graficos import colunas_pagina, desenhar_graficos, metricas_caches
+    from painel.instrumentacao import exibir_medicao
+
+    # Troca do snapshot sem reiniciar o servidor (painel.atualizacao)
+    if st.secrets.get('atualizacao_automatica', True):
+        iniciar_observador()
+
+    cabecalho()
+
+    # A página inteira usa a mesma versão dos dados, mesmo se o snapshot for trocado no meio
+    with fixar_pesquisa():
+        with etapa('filtros'):
+            # Só as colunas que os gráficos da página leem
+            filtered_data = filtrar_dados(colunas_pagina(PAGINAS[nome]))
+        if filtered_data is not None:
+            with etapa('gráficos', len(filtered_data)):
+                desenhar_graficos(PAGINAS[nome], filtered_data)
+
+    if medicao is not None:
+        registrar_medicao(medicao, {chave: st.session_state.get(chave) for chave in FILTROS_INICIAIS})
+        # Painel de instrumentação, só para administradores com a instrumentação ligada
+        if medicao.exibir:
+            exibir_medicao(medicao, metricas_caches())
+
+
+# Função para executar os scripts de todas as páginas só para registrar seus gráficos,
+# sem senha nem barra lateral (usada pelo benchmark)
+def registrar_paginas():
+    global _somente_registrar
+    scripts = sorted(glob.glob(os.path.join(RAIZ, '[0-9]*.py')))
+    scripts += sorted(glob.glob(os.path.join(RAIZ, 'pages', '[0-9]*.py')))
+    _somente_registrar = True
+    try:
+        for script in scripts:
+            runpy.run_path(script)
+    finally:
+        _somente_registrar = False
+    return PAGINAS
@@ -0,0 +1,114 @@
+# Troca do snapshot sem reiniciar o servidor: uma thread de fundo confere o manifesto
+# (snapshots/atual.json) a cada INTERVALO segundos. Quando a ingestão grava uma versão
+# nova, a thread abre o snapshot e monta os índices, o cubo, as incidências e o banco
+# bootstrap dessa versão; só então troca a pesquisa em uso, de uma vez. Execuções de
+# página já em andamento terminam na versão anterior, as seguintes usam a nova, e os
+# recursos da versão anterior são descartados.
+#
+# Ligado por padrão no servidor; para desligar, em .streamlit/secrets.toml:
+#   atualizacao_automatica = false
+import logging
+import os
+import threading
+import time
+
+from painel import dados
+
+# Segundos entre duas conferências do manifesto
+INTERVALO = 5
+
+logger = logging.getLogger(__name__)
+
+
+# Identidade do arquivo de manifesto: a ingestão troca o arquivo inteiro (os.replace)
+def _assinatura_manifesto():
+    try:
+        info = os.stat(os.path.join(dados.DIRETORIO_SNAPSHOTS, dados.MANIFESTO))
+    except FileNotFoundError:
+        return None
+    return info.st_ino, info.st_mtime_ns, info.st_size
+
+
+# Função para montar os recursos da versão da pesquisa fixada na thread
+def preparar_versao():
+    from painel.bootstrap import banco_bootstrap
+    from painel.cubo import cubo_respostas
+    from painel.filtros import indice_filtros
+    from painel.multipla import incidencias_multiplas
+    from painel.pesos import pesos_amostrais
+
+    indice_filtros()
+    cubo_respostas()
+    incidencias_multiplas()
+    banco_bootstrap()
+    pesos_amostrais()
+
+
+# Thread que acompanha o manifesto e troca a pesquisa em uso quando a versão muda
+class ObservadorSnapshots(threading.Thread):
+    def __init__(self, intervalo=INTERVALO):
+        super().__init__(name='observador-snapshots', daemon=True)
+        self.intervalo = intervalo
+        # Sem assinatura inicial: a primeira conferência compara a versão do manifesto
+        self.assinatura = None
+        self.assinatura_com_erro = None
+        self.trocas = 0
+        self.erro = None
+
+    def run(self):
+        while True:
+            try:
+                self.verificar()
+            except Exception as erro:
+                self.erro = repr(erro)
+                logger.exception('Falha ao trocar o snapshot da pesquisa')
+            time.sleep(self.intervalo)
+
+    # Confere o manifesto e troca a pesquisa se a versão mudou; devolve True se trocou
+    def verificar(self):
+        ativa = dados.versao_ativa()
+        # Recursos da versão anterior recriados por execuções que começaram antes da troca
+        if dados.RECURSOS.versoes() - {ativa}:
+            dados.RECURSOS.descartar({ativa})
+
+        assinatura = _assinatura_manifesto()
+        if assinatura in (self.assinatura, self.assinatura_com_erro):
+            return False
+        manifesto = dados.ler_manifesto()
+        if manifesto is None or manifesto['versao'] == ativa:
+            self.assinatura = assinatura
+            return False
+
+        try:
+            nova = dados.abrir_pesquisa(manifesto)
+            with dados.fixar_pesquisa(nova):
+                # As colunas que as páginas já leram na versão anterior
+                dados.carregar_pesquisa(dados.pesquisa_ativa().carregadas())
+                preparar_versao()
+        except Exception:
+            # Snapshot com defeito: a versão em uso continua até o próximo manifesto
+            self.assinatura_com_erro = assinatura
+            dados.RECURSOS.descartar({ativa})
+            raise
+
+        dados.trocar_pesquisa(nova)
+        dados.RECURSOS.descartar({manifesto['versao']})
+        self.assinatura = assinatura
+        self.trocas += 1
+        self.erro = None
+        logger.info('Pesquisa trocada para a versão %s', manifesto['versao'])
+        return True
+
+
+_observador = None
+_trava = threading.Lock()
+
+
+# Função para iniciar o observador uma única vez por processo
+def iniciar_observador(intervalo=INTERVALO):
+    global _observador
+    with _trava:
+        if _observador is None:
+            _observador = ObservadorSnapshots(intervalo)
+            _observador.start()
+    return _observador
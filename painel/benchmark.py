@@ -0,0 +1,244 @@
+# Benchmark do caminho dos dados de todas as páginas, sem navegador: importação dos
+# módulos num processo novo, leitura do snapshot (inteiro e só com as colunas de cada
+# página), limpeza da planilha, cadeia de filtros
+# da barra lateral, contagem de cada gráfico, intervalos bootstrap e montagem da figura
+# do Plotly, numa matriz de seleções de filtros.
+# Para cada etapa mostra a latência p50/p95 e o pico de memória alocada.
+#
+# Uso:
+#   python -m painel.benchmark
+#   python -m painel.benchmark --repeticoes 20 --pagina Renda --saida resultado.json
+#
+# Para medir em escala, gere uma base com `python -m painel.sintetico` e aponte
+# COFECI_SNAPSHOTS para os snapshots dela e --origem para o CSV gerado.
+import argparse
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+import tracemalloc
+from collections import defaultdict
+
+import numpy as np
+import streamlit as st
+
+from painel import RAIZ, dados, ingestao
+from painel.app import FILTROS_INICIAIS, recortar, registrar_paginas
+from painel.filtros import REGIOES_ESTADOS, indice_filtros
+from painel.graficos import (cache_agregacoes, cache_figuras, colunas_pagina, contar, desenhar_graficos,
+                             intervalos_bootstrap, montar_figura)
+
+# Versão do Streamlit em que _contexto_streamlit foi conferido (fixada em requirements.txt)
+VERSAO_STREAMLIT_CONTEXTO = '1.27.2'
+
+# Seleções de filtros medidas, com as mesmas chaves do estado da sessão
+CENARIOS = {
+    'brasil': {},
+    'nordeste': {'selected_estado': REGIOES_ESTADOS['Nordeste']},
+    'sp_jovem_feminino': {'selected_estado': ['São Paulo (SP)'], 'selected_idade': 'Menos de 35 anos',
+                          'selected_sexo': ['Feminino']},
+    'sul_capital_mais_35': {'selected_estado': REGIOES_ESTADOS['Sul'], 'selected_perg_7': 'Capital',
+                            'selected_idade': 'Mais de 35 anos'},
+    'superior_masculino': {'selected_escolaridade': ['Ensino Superior/Graduado'],
+                           'selected_sexo': ['Masculino']},
+    # Só fica ponderado quando há metas_pesos.json (ver painel.pesos)
+    'brasil_ponderado': {'ponderar': True},
+}
+
+# Etapas medidas, na ordem do caminho dos dados
+ETAPAS = ['importacao', 'carga', 'limpeza', 'filtro', 'agregacao', 'incerteza', 'figura', 'pagina',
+          'pagina (cache)']
+
+# Importações de um processo novo, na ordem em que acontecem no servidor: o Streamlit,
+# a tela de login, os módulos carregados na primeira página depois da senha e a
+# primeira figura (o Plotly carrega os validadores de cada tipo de gráfico sob demanda)
+IMPORTACOES = {
+    'streamlit': 'import streamlit',
+    'login': 'import painel.app',
+    'primeira pagina': 'import painel.graficos, painel.filtros, painel.recorte',
+    'primeira figura': 'import plotly.graph_objects as go; go.Figure(go.Bar(x=["a"], y=[1])).to_json()',
+}
+
+# Script executado em cada processo novo: mede cada importação na ordem e devolve
+# [segundos, pico de bytes alocados] por etapa, em JSON
+_SCRIPT_IMPORTACAO = '''
+import json, sys, time, tracemalloc
+importacoes, memoria = json.loads(sys.argv[1]), sys.argv[2] == '1'
+if memoria:
+    tracemalloc.start()
+resultado = {}
+for nome, codigo in importacoes.items():
+    antes = 0
+    if memoria:
+        antes = tracemalloc.get_traced_memory()[0]
+        tracemalloc.reset_peak()
+    inicio = time.perf_counter()
+    exec(codigo)
+    duracao = time.perf_counter() - inicio
+    resultado[nome] = [duracao, tracemalloc.get_traced_memory()[1] - antes if memoria else 0]
+print(json.dumps(resultado))
+'''
+
+
+# Os caches do Streamlit (st.cache_resource) só guardam valores dentro de uma execução
+# de script; fora do `streamlit run` o benchmark cria um contexto mínimo na thread atual
+# para medir o servidor como ele roda, com os índices e o cubo já carregados. O contexto
+# vem de módulos internos do Streamlit, que mudam entre versões: numa versão diferente da
+# conferida, a falha vira um erro que diz qual versão usar.
+def _contexto_streamlit():
+    try:
+        from streamlit.runtime.memory_uploaded_file_manager import MemoryUploadedFileManager
+        from streamlit.runtime.scriptrunner import ScriptRunContext, add_script_run_ctx
+        from streamlit.runtime.state import SafeSessionState, SessionState
+
+        contexto = ScriptRunContext(
+            session_id='benchmark',
+            _enqueue=lambda mensagem: None,
+            query_string='',
+            session_state=SafeSessionState(SessionState()),
+            uploaded_file_mgr=MemoryUploadedFileManager('/benchmark'),
+            page_script_hash='',
+            user_info={'email': 'benchmark'},
+        )
+    except (ImportError, TypeError) as erro:
+        raise RuntimeError(
+            f'O benchmark cria o contexto de execução com partes internas do Streamlit '
+            f'{VERSAO_STREAMLIT_CONTEXTO} (requirements.txt), mas a versão instalada é '
+            f'{st.__version__}: {erro}'
+        ) from erro
+    add_script_run_ctx(threading.current_thread(), contexto)
+
+
+# Filtros completos de um cenário: os valores iniciais da barra lateral com Brasil
+# inteiro selecionado, sobrescritos pelo cenário
+def filtros_cenario(cenario):
+    filtros = dict(FILTROS_INICIAIS, selected_estado=sorted(indice_filtros().valores('estado')))
+    filtros.update(CENARIOS[cenario])
+    return filtros
+
+
+# Acumula as medições de cada etapa: tempos em segundos e pico de memória em bytes
+class Medicoes:
+    def __init__(self, memoria=False):
+        self.memoria = memoria
+        self.tempos = defaultdict(list)
+        self.picos = defaultdict(int)
+
+    def medir(self, etapa, pagina, funcao, *args):
+        if self.memoria:
+            tracemalloc.reset_peak()
+            antes = tracemalloc.get_traced_memory()[0]
+        inicio = time.perf_counter()
+        resultado = funcao(*args)
+        self.tempos[etapa, pagina].append(time.perf_counter() - inicio)
+        if self.memoria:
+            pico = tracemalloc.get_traced_memory()[1] - antes
+            self.picos[etapa, pagina] = max(self.picos[etapa, pagina], pico)
+        return resultado
+
+
+# Função para medir as importações num processo Python novo, como no início do servidor
+def medir_importacoes(medicoes):
+    processo = subprocess.run(
+        [sys.executable, '-c', _SCRIPT_IMPORTACAO, json.dumps(IMPORTACOES), '1' if medicoes.memoria else '0'],
+        cwd=RAIZ, env=dict(os.environ, PYTHONPATH=RAIZ), capture_output=True, text=True, check=True,
+    )
+    for nome, (duracao, pico) in json.loads(processo.stdout.splitlines()[-1]).items():
+        medicoes.tempos['importacao', nome].append(duracao)
+        medicoes.picos['importacao', nome] = max(medicoes.picos['importacao', nome], pico)
+
+
+def _rodada(medicoes, paginas, bruta):
+    medir_importacoes(medicoes)
+    manifesto = dados.manifesto_dados()
+    medicoes.medir('carga', '-', dados.ler_snapshot, manifesto)
+    for nome, graficos in paginas.items():
+        medicoes.medir('carga', nome, dados.ler_snapshot, manifesto, dados.DIRETORIO_SNAPSHOTS,
+                       colunas_pagina(graficos))
+    medicoes.medir('limpeza', '-', lambda: ingestao.tipar_colunas(ingestao.limpar(bruta)))
+
+    colunas = colunas_pagina([grafico for graficos in paginas.values() for grafico in graficos])
+    for cenario in CENARIOS:
+        filtros = filtros_cenario(cenario)
+        recorte = medicoes.medir('filtro', '-', recortar, filtros, colunas)
+        efeito = recorte.efeito_desenho()
+        for nome, graficos in paginas.items():
+            for grafico in graficos:
+                contagem, total = medicoes.medir('agregacao', nome, contar, grafico, recorte)
+                intervalos = medicoes.medir('incerteza', nome, intervalos_bootstrap, grafico, recorte, contagem)
+                medicoes.medir('figura', nome,
+                               lambda: montar_figura(grafico, contagem, total, efeito, intervalos).to_json())
+            # Página inteira como numa nova sessão (caches vazios) e depois numa reexecução
+            cache_figuras().limpar()
+            cache_agregacoes().limpar()
+            medicoes.medir('pagina', nome, desenhar_graficos, graficos, recorte)
+            medicoes.medir('pagina (cache)', nome, desenhar_graficos, graficos, recorte)
+
+
+# Função que executa o benchmark e devolve uma linha por (etapa, página)
+def executar(repeticoes=5, pagina=None, memoria=True, origem=dados.ARQUIVO_CSV):
+    _contexto_streamlit()
+    paginas = {nome: graficos for nome, graficos in registrar_paginas().items()
+               if pagina is None or pagina.lower() in nome.lower()}
+    bruta = ingestao.ler_origem(origem)
+
+    # Rodada de aquecimento: carrega snapshot, índices, cubo e mapas de rótulos
+    _rodada(Medicoes(), paginas, bruta)
+
+    medicoes = Medicoes()
+    for _ in range(repeticoes):
+        _rodada(medicoes, paginas, bruta)
+
+    # O pico de memória sai de uma rodada separada, pois o tracemalloc deixa tudo mais lento
+    picos = Medicoes(memoria=True)
+    if memoria:
+        tracemalloc.start()
+        try:
+            _rodada(picos, paginas, bruta)
+        finally:
+            tracemalloc.stop()
+
+    linhas = []
+    for (etapa, nome), tempos in medicoes.tempos.items():
+        tempos = np.array(tempos) * 1000
+        linhas.append({
+            'etapa': etapa,
+            'pagina': nome,
+            'medicoes': len(tempos),
+            'p50_ms': float(np.percentile(tempos, 50)),
+            'p95_ms': float(np.percentile(tempos, 95)),
+            'pico_kb': picos.picos[etapa, nome] / 1024 if memoria else None,
+        })
+    return sorted(linhas, key=lambda linha: ETAPAS.index(linha['etapa']))
+
+
+def imprimir(linhas, saida=sys.stdout):
+    largura = max(len(linha['pagina']) for linha in linhas)
+    saida.write(f"{'etapa':<16}{'página':<{largura + 2}}{'n':>6}{'p50 (ms)':>11}{'p95 (ms)':>11}{'pico (KB)':>12}\n")
+    for linha in linhas:
+        pico = f"{linha['pico_kb']:12.1f}" if linha['pico_kb'] is not None else f"{'-':>12}"
+        saida.write(f"{linha['etapa']:<16}{linha['pagina']:<{largura + 2}}{linha['medicoes']:>6}"
+                    f"{linha['p50_ms']:>11.3f}{linha['p95_ms']:>11.3f}{pico}\n")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark do caminho dos dados das páginas do painel.')
+    parser.add_argument('--repeticoes', type=int, default=5, help='rodadas medidas (padrão: 5)')
+    parser.add_argument('--pagina', help='mede só as páginas cujo nome contém este texto')
+    parser.add_argument('--sem-memoria', action='store_true', help='não mede o pico de memória')
+    parser.add_argument('--origem', default=dados.ARQUIVO_CSV,
+                        help='exportação .csv usada na etapa de limpeza (padrão: cofeci.csv)')
+    parser.add_argument('--saida', help='grava o resultado em JSON neste arquivo')
+    args = parser.parse_args(argv)
+
+    linhas = executar(args.repeticoes, args.pagina, memoria=not args.sem_memoria, origem=args.origem)
+    imprimir(linhas)
+    if args.saida:
+        with open(args.saida, 'w', encoding='utf-8') as arquivo:
+            json.dump(linhas, arquivo, ensure_ascii=False, indent=2)
+
+
+if __name__ == '__main__':
+    main()
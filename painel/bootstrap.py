@@ -0,0 +1,115 @@
+# Banco de reamostragens bootstrap da pesquisa, gerado uma vez por parte dos dados
+# (snapshot e cada segmento anexado) junto com ela. No bootstrap de Poisson cada linha
+# entra em cada reamostragem um número de vezes sorteado de uma Poisson(1), independente
+# das demais linhas: respostas novas só acrescentam linhas ao banco, sem sortear de novo
+# as antigas. O banco guarda essas multiplicidades (matriz linhas x reamostragens de
+# uint8, mapeada em memória).
+#
+# Como o recorte filtrado é um subconjunto de linhas, as reamostragens do recorte são as
+# linhas do banco nas mesmas posições: os percentis de qualquer gráfico saem de uma
+# multiplicação (indicadores das respostas x reamostragens), sem sortear nada ao desenhar.
+import hashlib
+import os
+import tempfile
+
+import numpy as np
+
+from painel.dados import DIRETORIO_SNAPSHOTS, cache_versao, manifesto_dados, segmentos, versao_dados
+
+# Quantidade de reamostragens e nível de confiança dos intervalos percentis
+REPETICOES = 200
+CONFIANCA = 0.95
+
+# Linhas sorteadas de cada vez ao gerar o banco (limita a memória do sorteio)
+BLOCO = 65536
+
+
+# Semente fixa por arquivo de dados: a mesma parte sempre gera o mesmo banco
+def _semente(nome_dados):
+    return int(hashlib.sha256(nome_dados.encode()).hexdigest()[:12], 16)
+
+
+# Função para preencher `destino` (linhas x reamostragens) com quantas vezes cada linha
+# entra em cada reamostragem
+def gerar_banco(destino, semente):
+    rng = np.random.default_rng(semente)
+    for inicio in range(0, destino.shape[0], BLOCO):
+        fim = min(inicio + BLOCO, destino.shape[0])
+        destino[inicio:fim] = np.minimum(rng.poisson(1.0, size=(fim - inicio, destino.shape[1])), 255)
+    return destino
+
+
+# Função para gravar o banco das `linhas` do arquivo de dados `nome_dados` em .npy, ao
+# lado dele; devolve o nome do arquivo
+def gravar_banco(linhas, nome_dados, diretorio=DIRETORIO_SNAPSHOTS):
+    nome = nome_dados.rsplit('.', 1)[0] + '-bootstrap.npy'
+    descritor, temporario = tempfile.mkstemp(suffix='.npy', dir=diretorio)
+    os.close(descritor)
+    banco = np.lib.format.open_memmap(temporario, mode='w+', dtype=np.uint8, shape=(linhas, REPETICOES))
+    gerar_banco(banco, _semente(nome_dados))
+    banco.flush()
+    del banco
+    os.chmod(temporario, 0o644)
+    os.replace(temporario, os.path.join(diretorio, nome))
+    return nome
+
+
+# Banco de uma parte dos dados: o .npy mapeado em memória ou, para partes gravadas antes
+# do banco existir, sorteado em memória com a mesma semente
+def _abrir_banco(nome_dados, nome_banco, linhas):
+    if nome_banco and os.path.exists(os.path.join(DIRETORIO_SNAPSHOTS, nome_banco)):
+        return np.load(os.path.join(DIRETORIO_SNAPSHOTS, nome_banco), mmap_mode='r')
+    return gerar_banco(np.empty((linhas, REPETICOES), dtype=np.uint8), _semente(nome_dados))
+
+
+# Banco da pesquisa inteira, dividido como os arquivos de dados: as linhas pedidas são
+# buscadas em cada parte, sem juntar os arquivos numa cópia única
+class BancoBootstrap:
+    def __init__(self, partes):
+        self.partes = partes
+        self.inicios = np.cumsum([0] + [len(parte) for parte in partes])
+
+    def __len__(self):
+        return int(self.inicios[-1])
+
+    # Multiplicidades das linhas (posições em ordem crescente, como as de um recorte)
+    def __getitem__(self, linhas):
+        limites = np.searchsorted(linhas, self.inicios)
+        return np.concatenate([
+            parte[linhas[limites[i]:limites[i + 1]] - self.inicios[i]]
+            for i, parte in enumerate(self.partes)
+        ])
+
+
+# Banco aberto uma vez por versão dos dados e compartilhado entre as sessões
+@cache_versao
+def _carregar_banco(versao):
+    manifesto = manifesto_dados()
+    linhas_base = manifesto['linhas'] - sum(segmento['linhas'] for segmento in segmentos(manifesto))
+    partes = [_abrir_banco(manifesto['arquivo'], manifesto.get('bootstrap'), linhas_base)]
+    for segmento in segmentos(manifesto):
+        partes.append(_abrir_banco(segmento['arquivo'], segmento['bootstrap'], segmento['linhas']))
+    return BancoBootstrap(partes)
+
+
+def banco_bootstrap():
+    return _carregar_banco(versao_dados())
+
+
+# Função para calcular os intervalos percentis das proporções de um gráfico no recorte.
+# `indicadores` (linhas do recorte x rótulos) diz quanto cada linha conta em cada rótulo;
+# `denominador` (um valor por linha) é a base da porcentagem; None usa a soma dos rótulos.
+# Devolve as proporções inferior e superior de cada rótulo.
+def intervalos_percentis(indicadores, linhas, pesos=None, denominador=None):
+    reamostras = banco_bootstrap()[linhas].astype(np.float32)
+    if pesos is not None:
+        reamostras *= pesos[linhas, None].astype(np.float32)
+    contagens = indicadores.T @ reamostras
+    if denominador is None:
+        totais = contagens.sum(axis=0)
+    else:
+        totais = denominador.astype(np.float32) @ reamostras
+    proporcoes = contagens / np.maximum(totais, np.finfo(np.float32).tiny)
+    alfa = (1 - CONFIANCA) / 2 * 100
+    inferior, superior = np.percentile(proporcoes, [alfa, 100 - alfa], axis=1)
+    return inferior, superior
@@ -0,0 +1,95 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+# Cache LRU limitado pelo total de bytes guardados: ao passar do limite, saem
+# primeiro os itens usados há mais tempo. Itens mais velhos que `ttl` segundos
+# expiram. Compartilhado entre as sessões (threads) do Streamlit, por isso todo
+# acesso passa pela trava. Os contadores servem para dimensionar o limite.
+class CacheLRU:
+    def __init__(self, limite_bytes, ttl=None):
+        self.limite_bytes = limite_bytes
+        self.ttl = ttl
+        self.bytes = 0
+        self.acertos = 0
+        self.falhas = 0
+        self.remocoes = 0
+        self.expirados = 0
+        self.geracao = None
+        self._itens = OrderedDict()
+        self._trava = threading.Lock()
+
+    def __len__(self):
+        return len(self._itens)
+
+    def _remover(self, chave):
+        _, tamanho, _ = self._itens.pop(chave)
+        self.bytes -= tamanho
+
+    # Valor guardado na chave, ou None se não estiver no cache (ou tiver expirado)
+    def obter(self, chave):
+        with self._trava:
+            item = self._itens.get(chave)
+            if item is not None and item[2] is not None and item[2] < time.monotonic():
+                self._remover(chave)
+                self.expirados += 1
+                item = None
+            if item is None:
+                self.falhas += 1
+                return None
+            self._itens.move_to_end(chave)
+            self.acertos += 1
+            return item[0]
+
+    # Guarda o valor com o seu tamanho em bytes; valores maiores que o limite não entram
+    def guardar(self, chave, valor, tamanho):
+        if tamanho > self.limite_bytes:
+            return
+        expira_em = time.monotonic() + self.ttl if self.ttl is not None else None
+        with self._trava:
+            if chave in self._itens:
+                self._remover(chave)
+            self._itens[chave] = (valor, tamanho, expira_em)
+            self.bytes += tamanho
+            while self.bytes > self.limite_bytes:
+                self._remover(next(iter(self._itens)))
+                self.remocoes += 1
+
+    # Valor da chave; se não estiver no cache, calcula, guarda e devolve
+    def obter_ou_calcular(self, chave, calcular, medir):
+        valor = self.obter(chave)
+        if valor is None:
+            valor = calcular()
+            self.guardar(chave, valor, medir(valor))
+        return valor
+
+    def limpar(self):
+        with self._trava:
+            self._itens.clear()
+            self.bytes = 0
+
+    # Esvazia o cache quando a geração dos dados muda (ex.: troca do snapshot), pois as
+    # chaves da geração anterior não seriam mais consultadas
+    def renovar(self, geracao):
+        with self._trava:
+            if geracao != self.geracao:
+                self._itens.clear()
+                self.bytes = 0
+                self.geracao = geracao
+
+    # Contadores de uso do cache
+    def metricas(self):
+        with self._trava:
+            consultas = self.acertos + self.falhas
+            return {
+                'itens': len(self._itens),
+                'bytes': self.bytes,
+                'limite_bytes': self.limite_bytes,
+                'ttl': self.ttl,
+                'acertos': self.acertos,
+                'falhas': self.falhas,
+                'remocoes': self.remocoes,
+                'expirados': self.expirados,
+                'taxa_acerto': self.acertos / consultas if consultas else 0.0,
+            }
@@ -0,0 +1,172 @@
+# Memória compartilhada entre processos do servidor: com vários processos do Streamlit
+# atrás de um proxy, cada um teria a própria cópia da pesquisa, das incidências de
+# múltipla escolha e do cubo. Neste modo esses dados ficam num arquivo único por versão
+# (cofeci-<versão>-compartilhado.bin, com o índice em .json ao lado), mapeado em memória
+# só para leitura: as páginas do arquivo ficam uma vez no cache do sistema operacional e
+# todos os processos as usam. O banco bootstrap já é um .npy mapeado (painel.bootstrap).
+#
+# O primeiro processo a abrir uma versão grava o arquivo (se dois gravarem ao mesmo tempo,
+# fica o primeiro a terminar) e os demais só o mapeiam. Colunas de texto livre são a
+# exceção: vão codificadas no arquivo, mas o texto é montado em cada processo, pois o
+# pandas não guarda strings fora do heap do Python.
+#
+# Ligado com COFECI_MEMORIA_COMPARTILHADA=1 (painel.dados.MEMORIA_COMPARTILHADA).
+import json
+import os
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+from painel.dados import DIRETORIO_SNAPSHOTS, cache_versao, ler_multipla, ler_snapshot
+
+# Alinhamento de cada array dentro do arquivo, em bytes
+ALINHAMENTO = 64
+
+
+# Função para guardar uma lista de valores em `arrays` sob `nome`: números como array;
+# textos (o arquivo só guarda arrays de tipo fixo) como os bytes UTF-8 emendados e a
+# posição onde cada um começa
+def _guardar_valores(arrays, nome, valores):
+    valores = np.asarray(valores)
+    if valores.dtype.kind not in 'OU':
+        arrays[nome] = valores
+        return
+    codificados = [str(valor).encode() for valor in valores]
+    arrays[f'{nome}|utf8'] = np.frombuffer(b''.join(codificados), dtype=np.uint8)
+    arrays[f'{nome}|inicios'] = np.cumsum([0] + [len(valor) for valor in codificados], dtype=np.int64)
+
+
+# Valores guardados por `_guardar_valores`, como lista
+def _ler_valores(arrays, nome):
+    if nome in arrays:
+        return arrays[nome].tolist()
+    utf8 = arrays[f'{nome}|utf8'].tobytes()
+    inicios = arrays[f'{nome}|inicios'].tolist()
+    return [utf8[inicio:fim].decode() for inicio, fim in zip(inicios, inicios[1:])]
+
+
+# Função para gravar os arrays em sequência num arquivo binário e o índice (tipo, forma e
+# posição de cada array) num .json. Os dois entram no destino com os.link, que não
+# substitui um arquivo existente: se outro processo gravou antes, vale o dele, e quem já
+# mapeou o arquivo continua lendo as mesmas páginas.
+def gravar_arrays(caminho, arrays, colunas, diretorio=DIRETORIO_SNAPSHOTS):
+    indice = {}
+    descritor, binario = tempfile.mkstemp(suffix='.bin', dir=diretorio)
+    with os.fdopen(descritor, 'wb') as arquivo:
+        for nome, valor in arrays.items():
+            valor = np.ascontiguousarray(valor)
+            arquivo.write(b'\0' * (-arquivo.tell() % ALINHAMENTO))
+            indice[nome] = [valor.dtype.str, list(valor.shape), arquivo.tell()]
+            arquivo.write(valor.tobytes())
+        # Folga no fim: arrays vazios também apontam para dentro do arquivo
+        arquivo.write(b'\0' * ALINHAMENTO)
+    descritor, temporario = tempfile.mkstemp(suffix='.json', dir=diretorio)
+    with os.fdopen(descritor, 'w', encoding='utf-8') as arquivo:
+        json.dump({'colunas': colunas, 'arrays': indice}, arquivo, ensure_ascii=False)
+
+    # O .json só aparece depois do .bin: quem encontra o índice encontra os dados
+    for temporario, destino in [(binario, caminho + '.bin'), (temporario, caminho + '.json')]:
+        os.chmod(temporario, 0o644)
+        try:
+            os.link(temporario, destino)
+        except FileExistsError:
+            pass
+        os.unlink(temporario)
+
+
+# Função para montar os arrays de uma versão: colunas da pesquisa (códigos e categorias,
+# ou os valores), incidências de múltipla escolha e o cubo já somado aos segmentos
+def montar_arrays(manifesto, diretorio=DIRETORIO_SNAPSHOTS):
+    from painel.cubo import montar_cubo
+    from painel.multipla import montar_incidencias
+
+    pesquisa = ler_snapshot(manifesto, diretorio)
+    arrays = {}
+    colunas = []
+    for nome, serie in pesquisa.items():
+        if isinstance(serie.dtype, pd.CategoricalDtype):
+            tipo = 'categoria'
+        elif serie.dtype == object:
+            tipo = 'texto'
+            serie = serie.astype('category')
+        else:
+            arrays[f'coluna|{nome}'] = serie.to_numpy()
+            colunas.append([nome, 'valores', False])
+            continue
+        arrays[f'coluna|{nome}|codigos'] = serie.cat.codes.to_numpy()
+        _guardar_valores(arrays, f'coluna|{nome}|categorias', serie.cat.categories)
+        colunas.append([nome, tipo, bool(serie.cat.ordered)])
+
+    incidencias = montar_incidencias(ler_multipla(manifesto, diretorio), len(pesquisa))
+    for pergunta, incidencia in incidencias.items():
+        _guardar_valores(arrays, f'multipla|{pergunta}|opcoes', incidencia.opcoes)
+        arrays[f'multipla|{pergunta}|linhas'] = incidencia.linhas
+        arrays[f'multipla|{pergunta}|codigos'] = incidencia.codigos
+
+    # Rótulos e categorias do cubo são poucos: ficam como arrays '<U'
+    for chave, valor in montar_cubo(manifesto, diretorio).arrays().items():
+        arrays[f'cubo|{chave}'] = valor.astype(str) if valor.dtype == object else valor
+    return arrays, colunas
+
+
+# Arquivo da versão mapeado em memória (gravado na primeira abertura): devolve a descrição
+# das colunas e os arrays, que são vistas somente leitura sobre o mapeamento
+@cache_versao
+def _abrir(versao, _manifesto):
+    caminho = os.path.join(DIRETORIO_SNAPSHOTS, f'cofeci-{versao}-compartilhado')
+    if not os.path.exists(caminho + '.json'):
+        gravar_arrays(caminho, *montar_arrays(_manifesto))
+    with open(caminho + '.json', encoding='utf-8') as arquivo:
+        indice = json.load(arquivo)
+    mapa = np.memmap(caminho + '.bin', dtype=np.uint8, mode='r')
+    arrays = {
+        nome: np.ndarray(tuple(forma), dtype=np.dtype(tipo), buffer=mapa, offset=posicao)
+        for nome, (tipo, forma, posicao) in indice['arrays'].items()
+    }
+    return indice['colunas'], arrays
+
+
+def _arrays(manifesto, prefixo):
+    _, arrays = _abrir(manifesto['versao'], manifesto)
+    return {nome[len(prefixo):]: valor for nome, valor in arrays.items() if nome.startswith(prefixo)}
+
+
+# Nomes das colunas da pesquisa guardadas no arquivo
+def colunas_compartilhadas(manifesto):
+    colunas, _ = _abrir(manifesto['versao'], manifesto)
+    return [nome for nome, _, _ in colunas]
+
+
+# Pesquisa com as colunas apoiadas no arquivo mapeado: categorias guardam os códigos do
+# arquivo, colunas numéricas e de data são o próprio array (sem juntar colunas do mesmo
+# tipo num bloco, o que copiaria os dados). Com `colunas`, só essas são montadas.
+def pesquisa_compartilhada(manifesto, colunas=None):
+    descricao, arrays = _abrir(manifesto['versao'], manifesto)
+    if colunas is not None:
+        descricao = [coluna for coluna in descricao if coluna[0] in colunas]
+    series = {}
+    for nome, tipo, ordenada in descricao:
+        if tipo == 'valores':
+            series[nome] = pd.Series(arrays[f'coluna|{nome}'], name=nome, copy=False)
+            continue
+        codigos = arrays[f'coluna|{nome}|codigos']
+        categorias = pd.Index(_ler_valores(arrays, f'coluna|{nome}|categorias'))
+        valores = pd.Categorical.from_codes(codigos, dtype=pd.CategoricalDtype(categorias, ordenada))
+        series[nome] = pd.Series(valores if tipo == 'categoria' else valores.astype(object), name=nome)
+    return pd.DataFrame(series, copy=False)
+
+
+# Arrays do cubo de contagens no formato gravado pela ingestão
+def cubo_compartilhado(manifesto):
+    return _arrays(manifesto, 'cubo|')
+
+
+# Incidências de múltipla escolha: (opções, linhas, códigos) de cada pergunta
+def incidencias_compartilhadas(manifesto):
+    arrays = _arrays(manifesto, 'multipla|')
+    perguntas = dict.fromkeys(nome.split('|', 1)[0] for nome in arrays)
+    return {
+        pergunta: (_ler_valores(arrays, f'{pergunta}|opcoes'), arrays[f'{pergunta}|linhas'], arrays[f'{pergunta}|codigos'])
+        for pergunta in perguntas
+    }
@@ -0,0 +1,4 @@
+# Cores das perguntas de sim/não, usadas pelas descrições dos gráficos das páginas.
+# Módulo leve de propósito: as páginas o importam antes da senha.
+CORES_SIM_NAO = {'Sim': '#1dbde6', 'Não': '#f1515e'}
+CORES_NAO_SIM = {'Sim': '#f1515e', 'Não': '#1dbde6'}
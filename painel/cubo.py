@@ -0,0 +1,230 @@
+import numpy as np
+import pandas as pd
+import streamlit as st
+
+from painel.dados import (DIRETORIO_SNAPSHOTS, MEMORIA_COMPARTILHADA, cache_versao, ler_cubo, manifesto_dados,
+                          segmentos, versao_dados)
+from painel.filtros import COLUNAS_FILTRO, DIMENSOES_CUBO, codigos_faixa_idade
+
+# Chave da sessão com a seleção de cada dimensão do cubo na barra lateral
+CHAVES_SESSAO = {
+    'estado': 'selected_estado',
+    'capital': 'selected_perg_7',
+    'idade': 'selected_idade',
+    'escolaridade': 'selected_escolaridade',
+    'sexo': 'selected_sexo',
+}
+
+# Valores da barra lateral que equivalem a não filtrar a dimensão
+SEM_FILTRO = ['Ambos', 'Todos']
+
+
+# Cubo de contagens gerado na ingestão: para cada pergunta, quantos respondentes deram
+# cada resposta em cada célula (estado x capital x faixa de idade x escolaridade x sexo).
+# Uma combinação de filtros vira uma máscara de células e a contagem de uma pergunta
+# soma só as células marcadas, sem percorrer as linhas da pesquisa.
+class CuboRespostas:
+    def __init__(self, arrays):
+        self.forma = tuple(int(n) for n in arrays['forma'])
+        self.rotulos = {d: list(arrays[f'dimensao|{d}']) for d in DIMENSOES_CUBO}
+        self.respondentes = arrays['respondentes']
+        self.perguntas = {}
+        for chave, valor in arrays.items():
+            if chave.endswith('|celula'):
+                pergunta = chave.split('|')[0]
+                self.perguntas[pergunta] = (
+                    arrays[f'{pergunta}|categorias'],
+                    valor,
+                    arrays[f'{pergunta}|categoria'],
+                    arrays[f'{pergunta}|contagem'],
+                )
+
+    def __contains__(self, pergunta):
+        return pergunta in self.perguntas
+
+    # Função para somar ao cubo as contagens de um segmento anexado (cubo montado só com
+    # as linhas novas, com os próprios rótulos e categorias). O custo depende do tamanho do
+    # segmento: as células do segmento são traduzidas para as do cubo e suas contagens
+    # entram como entradas a mais (células repetidas somam no bincount de `contar`).
+    def anexar(self, arrays):
+        delta = CuboRespostas(arrays)
+        traducoes = []
+        for dimensao in DIMENSOES_CUBO:
+            novos = [r for r in delta.rotulos[dimensao] if r not in self.rotulos[dimensao]]
+            if novos:
+                self._ampliar_eixo(dimensao, novos)
+            rotulos = self.rotulos[dimensao]
+            traducao = [rotulos.index(r) for r in delta.rotulos[dimensao]]
+            # Posição de quem não respondeu (a idade não tem)
+            if dimensao != 'idade':
+                traducao.append(len(rotulos))
+            traducoes.append(np.array(traducao, dtype=np.int64))
+
+        def traduzir(celulas):
+            eixos = np.unravel_index(celulas, delta.forma)
+            return np.ravel_multi_index([t[e] for t, e in zip(traducoes, eixos)], self.forma)
+
+        ocupadas = np.flatnonzero(delta.respondentes)
+        self.respondentes = self.respondentes + np.bincount(
+            traduzir(ocupadas), weights=delta.respondentes[ocupadas],
+            minlength=len(self.respondentes)).astype(self.respondentes.dtype)
+
+        for pergunta, (categorias, celula, categoria, contagem) in delta.perguntas.items():
+            celula = traduzir(celula).astype(np.int32)
+            if pergunta not in self.perguntas:
+                self.perguntas[pergunta] = (categorias, celula, categoria, contagem)
+                continue
+            atuais, celulas_atuais, categoria_atual, contagem_atual = self.perguntas[pergunta]
+            posicao = pd.Index(atuais).get_indexer(categorias)
+            novas = posicao < 0
+            if novas.any():
+                posicao[novas] = len(atuais) + np.arange(novas.sum())
+                atuais = np.concatenate([atuais, categorias[novas]])
+            self.perguntas[pergunta] = (
+                atuais,
+                np.concatenate([celulas_atuais, celula]),
+                np.concatenate([categoria_atual, posicao[categoria].astype(np.int32)]),
+                np.concatenate([contagem_atual, contagem]),
+            )
+
+    # Arrays no formato gravado pela ingestão, já com os segmentos somados
+    def arrays(self):
+        arrays = {'forma': np.array(self.forma, dtype=np.int64), 'respondentes': self.respondentes}
+        for dimensao in DIMENSOES_CUBO:
+            arrays[f'dimensao|{dimensao}'] = np.array(self.rotulos[dimensao])
+        for pergunta, (categorias, celula, categoria, contagem) in self.perguntas.items():
+            arrays[f'{pergunta}|categorias'] = categorias
+            arrays[f'{pergunta}|celula'] = celula
+            arrays[f'{pergunta}|categoria'] = categoria
+            arrays[f'{pergunta}|contagem'] = contagem
+        return arrays
+
+    # Acrescenta rótulos novos no fim do eixo (antes da posição de quem não respondeu) e
+    # renumera as células já guardadas para a nova forma
+    def _ampliar_eixo(self, dimensao, novos):
+        eixo = DIMENSOES_CUBO.index(dimensao)
+        forma_antiga = self.forma
+        tamanho = len(self.rotulos[dimensao])
+        self.rotulos[dimensao] = self.rotulos[dimensao] + novos
+        self.forma = tuple(n + len(novos) if i == eixo else n for i, n in enumerate(forma_antiga))
+
+        def renumerar(celulas):
+            eixos = list(np.unravel_index(celulas, forma_antiga))
+            if dimensao != 'idade':
+                eixos[eixo] = np.where(eixos[eixo] == tamanho, tamanho + len(novos), eixos[eixo])
+            return np.ravel_multi_index(eixos, self.forma)
+
+        ocupadas = np.flatnonzero(self.respondentes)
+        respondentes = np.zeros(int(np.prod(self.forma)), dtype=self.respondentes.dtype)
+        respondentes[renumerar(ocupadas)] = self.respondentes[ocupadas]
+        self.respondentes = respondentes
+        for pergunta, (categorias, celula, categoria, contagem) in self.perguntas.items():
+            self.perguntas[pergunta] = (categorias, renumerar(celula).astype(np.int32), categoria, contagem)
+
+    # Máscara das células que atendem à seleção; None numa dimensão aceita todas as
+    # posições do eixo, inclusive a de quem não respondeu
+    def celulas(self, **selecoes):
+        mascara = np.ones(1, dtype=bool)
+        for dimensao, tamanho in zip(DIMENSOES_CUBO, self.forma):
+            valores = selecoes.get(dimensao)
+            eixo = np.ones(tamanho, dtype=bool)
+            if valores is not None:
+                eixo[:] = False
+                rotulos = self.rotulos[dimensao]
+                eixo[[rotulos.index(v) for v in valores if v in rotulos]] = True
+            mascara = np.logical_and.outer(mascara, eixo).ravel()
+        return mascara
+
+    # Respostas possíveis da pergunta, na ordem dos códigos do cubo
+    def categorias(self, pergunta):
+        return self.perguntas[pergunta][0]
+
+    # Quantidade de respondentes nas células marcadas
+    def contar_respondentes(self, celulas):
+        return int(self.respondentes[celulas].sum())
+
+    # Contagem de cada resposta da pergunta nas células marcadas, na ordem dos códigos;
+    # com `pesos` (um peso por célula) a contagem é ponderada
+    def contar(self, pergunta, celulas, pesos=None):
+        categorias, celula, categoria, contagem = self.perguntas[pergunta]
+        marcadas = celulas[celula]
+        contagem = contagem[marcadas]
+        if pesos is not None:
+            contagem = contagem * pesos[celula[marcadas]]
+        soma = np.bincount(categoria[marcadas], weights=contagem, minlength=len(categorias))
+        return soma if pesos is not None else soma.astype(np.int64)
+
+    # Célula do cubo de cada linha da pesquisa (mesma codificação da ingestão)
+    def celulas_das_linhas(self, pesquisa):
+        codigos = []
+        for dimensao in DIMENSOES_CUBO:
+            if dimensao == 'idade':
+                codigos.append(codigos_faixa_idade(pesquisa['PERG.5']))
+                continue
+            rotulos = pd.Index(self.rotulos[dimensao])
+            codigo = rotulos.get_indexer(pesquisa[COLUNAS_FILTRO[dimensao]].astype(object))
+            # Última posição do eixo: sem resposta
+            codigos.append(np.where(codigo < 0, len(rotulos), codigo))
+        return np.ravel_multi_index(codigos, self.forma)
+
+
+# Função para montar o cubo de uma versão: o do snapshot mais o de cada segmento
+# anexado pela ingestão incremental
+def montar_cubo(manifesto, diretorio=DIRETORIO_SNAPSHOTS):
+    cubo = CuboRespostas(ler_cubo(manifesto, diretorio))
+    for segmento in segmentos(manifesto):
+        cubo.anexar(ler_cubo(segmento, diretorio))
+    return cubo
+
+
+# Cubo carregado uma vez por versão dos dados e compartilhado entre sessões (e entre
+# processos, no modo de memória compartilhada)
+@cache_versao
+def _carregar_cubo(versao):
+    if MEMORIA_COMPARTILHADA:
+        from painel.compartilhado import cubo_compartilhado
+        return CuboRespostas(cubo_compartilhado(manifesto_dados()))
+    return montar_cubo(manifesto_dados())
+
+
+def cubo_respostas():
+    return _carregar_cubo(versao_dados())
+
+
+# Valores escolhidos em cada dimensão, a partir dos filtros com as mesmas chaves da
+# sessão; dimensões sem filtro ficam de fora
+def selecoes_filtros(filtros):
+    selecoes = {}
+    for dimensao, chave in CHAVES_SESSAO.items():
+        valor = filtros.get(chave)
+        if not valor or valor in SEM_FILTRO:
+            continue
+        selecoes[dimensao] = [valor] if isinstance(valor, str) else list(valor)
+    return selecoes
+
+
+# Função para obter a máscara de células dos filtros (por padrão, os atuais da barra lateral)
+def celulas_selecionadas(filtros=None):
+    if filtros is None:
+        filtros = st.session_state
+    return cubo_respostas().celulas(**selecoes_filtros(filtros))
+
+
+# Função para contar cada resposta da coluna no recorte, na ordem dos códigos do cubo.
+# Usa o cubo quando o recorte traz as células dos filtros e elas somam exatamente as
+# linhas do recorte; senão, conta os códigos das linhas. Recorte ponderado dá contagens
+# ponderadas (float).
+def contar_codigos(recorte, coluna):
+    cubo = cubo_respostas()
+    celulas = recorte.celulas
+    pesos = recorte.pesos
+    if celulas is not None and cubo.contar_respondentes(celulas) == len(recorte):
+        return cubo.contar(coluna, celulas, None if pesos is None else pesos.por_celula)
+
+    categorias = cubo.categorias(coluna)
+    codigos = recorte.codigos(coluna, categorias)
+    validos = codigos >= 0
+    if pesos is None:
+        return np.bincount(codigos[validos], minlength=len(categorias)).astype(np.int64)
+    return np.bincount(codigos[validos], weights=pesos.por_linha[recorte.linhas][validos],
+                       minlength=len(categorias))
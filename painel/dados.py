@@ -0,0 +1,272 @@
+import functools
+import inspect
+import json
+import os
+import threading
+from contextlib import contextmanager
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.feather as feather
+
+from painel import RAIZ
+
+# Exportação da planilha usada quando ainda não há snapshot gerado
+ARQUIVO_CSV = os.path.join(RAIZ, 'cofeci.csv')
+
+# Snapshots binários (Arrow) gerados por `python -m painel.ingestao`; a variável de
+# ambiente COFECI_SNAPSHOTS aponta para outro diretório (ex.: uma base sintética)
+DIRETORIO_SNAPSHOTS = os.environ.get('COFECI_SNAPSHOTS', os.path.join(RAIZ, 'snapshots'))
+MANIFESTO = 'atual.json'
+
+# Com vários processos do servidor, COFECI_MEMORIA_COMPARTILHADA=1 faz todos usarem uma
+# só cópia da pesquisa, das incidências e do cubo (painel.compartilhado)
+MEMORIA_COMPARTILHADA = os.environ.get('COFECI_MEMORIA_COMPARTILHADA', '') == '1'
+
+# Versão do formato do snapshot: aumentar sempre que a limpeza ou os tipos mudarem
+VERSAO_SNAPSHOT = 4
+
+# Colunas de texto com mais respostas distintas que essa fração das linhas
+# (nomes, comentários livres) continuam como texto em vez de categoria
+LIMITE_CATEGORIAS = 0.5
+
+# Perguntas de múltipla escolha, gravadas na planilha como opções separadas por vírgula
+PERGUNTAS_MULTIPLA = ['PERG.15', 'PERG.29', 'PERG.33', 'PERG.60', 'PERG.61', 'PERG.63', 'PERG.67']
+
+
+# Função para ler o manifesto do snapshot atual (None se não houver)
+def ler_manifesto(diretorio=DIRETORIO_SNAPSHOTS):
+    caminho = os.path.join(diretorio, MANIFESTO)
+    if not os.path.exists(caminho):
+        return None
+    with open(caminho, encoding='utf-8') as arquivo:
+        manifesto = json.load(arquivo)
+    # Snapshot de um formato antigo precisa ser gerado de novo
+    if not manifesto['versao'].startswith(f'v{VERSAO_SNAPSHOT}-'):
+        return None
+    return manifesto
+
+
+# Segmentos anexados pela ingestão incremental, na ordem em que foram gravados
+def segmentos(manifesto):
+    return manifesto.get('segmentos', [])
+
+
+# Função para juntar os DataFrames do snapshot e dos segmentos; colunas categóricas
+# ficam com a união das categorias de cada parte
+def _concatenar(partes):
+    if len(partes) == 1:
+        return partes[0]
+    colunas = {}
+    for coluna in partes[0].columns:
+        series = [parte[coluna] for parte in partes]
+        if all(isinstance(serie.dtype, pd.CategoricalDtype) for serie in series):
+            colunas[coluna] = pd.Series(pd.api.types.union_categoricals(series))
+        else:
+            colunas[coluna] = pd.concat(series, ignore_index=True)
+    return pd.DataFrame(colunas)
+
+
+def _ler_arrow(nome, diretorio, colunas=None):
+    return feather.read_table(os.path.join(diretorio, nome), columns=colunas, memory_map=True).to_pandas()
+
+
+# Função para abrir o snapshot mapeado em memória, com os segmentos anexados depois dele;
+# com `colunas`, só essas colunas são lidas do formato colunar
+def ler_snapshot(manifesto, diretorio=DIRETORIO_SNAPSHOTS, colunas=None):
+    nomes = [manifesto['arquivo']] + [segmento['arquivo'] for segmento in segmentos(manifesto)]
+    return _concatenar([_ler_arrow(nome, diretorio, colunas) for nome in nomes])
+
+
+# Nomes das colunas do snapshot, lidos do esquema do arquivo (sem ler os dados)
+def colunas_snapshot(manifesto, diretorio=DIRETORIO_SNAPSHOTS):
+    with pa.memory_map(os.path.join(diretorio, manifesto['arquivo'])) as arquivo:
+        return pa.ipc.open_file(arquivo).schema.names
+
+
+# Função para abrir as respostas de múltipla escolha já separadas (pergunta, linha, opção);
+# as linhas dos segmentos já vêm numeradas a partir do fim das partes anteriores
+def ler_multipla(manifesto, diretorio=DIRETORIO_SNAPSHOTS):
+    nomes = [manifesto['multipla']] + [segmento['multipla'] for segmento in segmentos(manifesto)]
+    return _concatenar([_ler_arrow(nome, diretorio) for nome in nomes])
+
+
+# Função para abrir o cubo de contagens pré-agregadas (do snapshot ou de um segmento)
+def ler_cubo(manifesto, diretorio=DIRETORIO_SNAPSHOTS):
+    with np.load(os.path.join(diretorio, manifesto['cubo'])) as arquivo:
+        return dict(arquivo)
+
+
+# Marca de chave ausente em RecursosVersao (o valor guardado pode ser None)
+_AUSENTE = object()
+
+
+# Recursos derivados de uma versão dos dados (índices, cubo, incidências...), guardados
+# uma vez por processo e compartilhados entre as sessões. Faz o papel do st.cache_resource,
+# que só guarda valores dentro de uma execução de página: aqui a versão nova pode ser
+# montada numa thread de fundo (painel.atualizacao) e a antiga descartada depois da troca.
+class RecursosVersao:
+    def __init__(self):
+        self._valores = {}
+        self._travas = {}
+        self._trava = threading.Lock()
+
+    def __len__(self):
+        return len(self._valores)
+
+    # Valor da chave na versão; se ainda não existir, só uma thread calcula e as demais
+    # esperam. O dicionário é lido uma vez só: descartar() pode apagar a chave a qualquer
+    # momento, durante a troca do snapshot
+    def obter(self, versao, chave, calcular):
+        chave = (versao, chave)
+        valor = self._valores.get(chave, _AUSENTE)
+        if valor is not _AUSENTE:
+            return valor
+        with self._trava:
+            trava = self._travas.setdefault(chave, threading.Lock())
+        with trava:
+            valor = self._valores.get(chave, _AUSENTE)
+            if valor is _AUSENTE:
+                valor = calcular()
+                self._valores[chave] = valor
+            return valor
+
+    # Versões com recursos guardados
+    def versoes(self):
+        with self._trava:
+            return {versao for versao, _ in self._valores}
+
+    # Descarta os recursos de todas as versões fora de `manter`
+    def descartar(self, manter):
+        with self._trava:
+            for chave in [c for c in self._valores if c[0] not in manter]:
+                del self._valores[chave]
+                self._travas.pop(chave, None)
+
+
+RECURSOS = RecursosVersao()
+
+
+# Decorador das funções que montam um recurso a partir da versão dos dados: o parâmetro
+# `versao` e os demais argumentos formam a chave (parâmetros com _ no início ficam de fora)
+def cache_versao(funcao):
+    assinatura = inspect.signature(funcao)
+
+    @functools.wraps(funcao)
+    def envolvida(*args, **kwargs):
+        argumentos = assinatura.bind(*args, **kwargs).arguments
+        chave = (funcao.__module__, funcao.__qualname__) + tuple(
+            valor for nome, valor in argumentos.items() if nome != 'versao' and not nome.startswith('_'))
+        return RECURSOS.obter(argumentos['versao'], chave, lambda: funcao(*args, **kwargs))
+    return envolvida
+
+
+# Pesquisa de uma versão dos dados com as colunas lidas sob demanda: cada coluna sai do
+# snapshot (só ela, do formato colunar) na primeira vez que uma página a pede e fica
+# guardada para as seguintes. Colunas que nenhuma página usa (nomes, comentários livres)
+# nunca são lidas. `ler_colunas` recebe a lista de nomes e devolve um DataFrame com elas.
+class Pesquisa:
+    def __init__(self, manifesto, colunas, ler_colunas):
+        self.manifesto = manifesto
+        self.colunas = list(colunas)
+        self._ler_colunas = ler_colunas
+        self._series = {}
+        self._trava = threading.Lock()
+
+    def __len__(self):
+        return self.manifesto['linhas']
+
+    # Colunas já lidas
+    def carregadas(self):
+        return list(self._series)
+
+    # DataFrame compartilhado só com as colunas pedidas (todas, por padrão), na ordem pedida
+    def tabela(self, colunas=None):
+        colunas = self.colunas if colunas is None else list(dict.fromkeys(colunas))
+        if any(coluna not in self._series for coluna in colunas):
+            with self._trava:
+                faltantes = [coluna for coluna in colunas if coluna not in self._series]
+                if faltantes:
+                    self._series.update(self._ler_colunas(faltantes).items())
+        tabela = pd.DataFrame({coluna: self._series[coluna] for coluna in colunas},
+                              index=pd.RangeIndex(len(self)), copy=False)
+        tabela.attrs['manifesto'] = self.manifesto
+        return tabela
+
+
+# Pesquisa em uso pelo processo, trocada por inteiro quando um snapshot novo fica pronto
+_pesquisa_ativa = None
+_trava_carga = threading.Lock()
+
+# Pesquisa fixada na thread atual: uma execução de página usa uma só versão do começo ao
+# fim, mesmo que a troca aconteça no meio dela
+_fixada = threading.local()
+
+
+# Função para abrir a pesquisa de um manifesto (as colunas são lidas depois, sob demanda)
+def abrir_pesquisa(manifesto):
+    if MEMORIA_COMPARTILHADA:
+        from painel.compartilhado import colunas_compartilhadas, pesquisa_compartilhada
+        return Pesquisa(manifesto, colunas_compartilhadas(manifesto),
+                        lambda colunas: pesquisa_compartilhada(manifesto, colunas))
+    return Pesquisa(manifesto, colunas_snapshot(manifesto), lambda colunas: ler_snapshot(manifesto, colunas=colunas))
+
+
+# Pesquisa em uso, carregada na primeira chamada do processo
+def pesquisa_ativa():
+    global _pesquisa_ativa
+    if _pesquisa_ativa is None:
+        with _trava_carga:
+            if _pesquisa_ativa is None:
+                manifesto = ler_manifesto()
+                if manifesto is None:
+                    # Primeira execução: gera o snapshot a partir da exportação em CSV
+                    from painel.ingestao import ingerir
+                    manifesto = ingerir(ARQUIVO_CSV)
+                _pesquisa_ativa = abrir_pesquisa(manifesto)
+    return _pesquisa_ativa
+
+
+# Troca atômica da pesquisa em uso: as próximas execuções de página já usam a nova
+def trocar_pesquisa(pesquisa):
+    global _pesquisa_ativa
+    _pesquisa_ativa = pesquisa
+
+
+# Fixa a pesquisa (por padrão, a em uso) na thread atual durante o bloco
+@contextmanager
+def fixar_pesquisa(pesquisa=None):
+    anterior = getattr(_fixada, 'pesquisa', None)
+    _fixada.pesquisa = pesquisa if pesquisa is not None else pesquisa_ativa()
+    try:
+        yield _fixada.pesquisa
+    finally:
+        _fixada.pesquisa = anterior
+
+
+# Pesquisa da thread: a fixada ou, fora de um bloco fixar_pesquisa, a em uso
+def _pesquisa_atual():
+    pesquisa = getattr(_fixada, 'pesquisa', None)
+    return pesquisa if pesquisa is not None else pesquisa_ativa()
+
+
+# Pesquisa compartilhada entre páginas e sessões, só com as `colunas` pedidas (todas, por
+# padrão). As colunas do DataFrame devolvido são as mesmas para todos e não devem ser alteradas.
+def carregar_pesquisa(colunas=None):
+    return _pesquisa_atual().tabela(colunas)
+
+
+# Manifesto do snapshot carregado
+def manifesto_dados():
+    return _pesquisa_atual().manifesto
+
+
+# Versão do snapshot carregado, usada como chave dos índices e caches derivados
+def versao_dados():
+    return manifesto_dados()['versao']
+
+
+# Versão da pesquisa em uso pelo processo (a fixada na thread pode ser a anterior)
+def versao_ativa():
+    return pesquisa_ativa().manifesto['versao']
@@ -0,0 +1,104 @@
+import numpy as np
+
+from painel.dados import cache_versao, carregar_pesquisa, versao_dados
+
+# Colunas usadas pelos filtros da barra lateral
+COLUNAS_FILTRO = {
+    'estado': 'PERG.6',
+    'capital': 'PERG.7',
+    'escolaridade': 'PERG.16',
+    'sexo': 'PERG.9',
+}
+
+# Faixas do filtro de idade (quem tem exatamente 35 anos não entra em nenhuma)
+FAIXAS_IDADE = {
+    'Menos de 35 anos': lambda idade: idade < 35,
+    'Mais de 35 anos': lambda idade: idade > 35,
+}
+
+# Colunas lidas para montar o índice dos filtros e as células do cubo de cada linha
+COLUNAS_INDICE = list(COLUNAS_FILTRO.values()) + ['PERG.5']
+
+# Dimensões do cubo de contagens, na ordem dos eixos
+DIMENSOES_CUBO = ['estado', 'capital', 'idade', 'escolaridade', 'sexo']
+
+
+# Código da faixa de idade do filtro: a posição em FAIXAS_IDADE, ou len(FAIXAS_IDADE) para 35 anos
+def codigos_faixa_idade(idade):
+    idade = np.asarray(idade)
+    codigos = np.full(len(idade), len(FAIXAS_IDADE), dtype=np.int8)
+    for codigo, regra in enumerate(FAIXAS_IDADE.values()):
+        codigos[regra(idade)] = codigo
+    return codigos
+
+
+# Mapeamento de Regiões para Estados
+REGIOES_ESTADOS = {
+    'Centro-Oeste': ['Goiás (GO)', 'Mato Grosso (MT)', 'Mato Grosso do Sul (MS)', 'Distrito Federal (DF)'],
+    'Nordeste': ['Alagoas (AL)', 'Bahia (BA)', 'Ceará (CE)', 'Maranhão (MA)', 'Paraíba (PB)', 'Pernambuco (PE)', 'Piauí (PI)', 'Rio Grande do Norte (RN)', 'Sergipe (SE)'],
+    'Norte': ['Acre (AC)', 'Amapá (AP)', 'Amazonas (AM)', 'Pará (PA)', 'Rondônia (RO)', 'Roraima (RR)', 'Tocantins (TO)'],
+    'Sudeste': ['Espírito Santo (ES)', 'Minas Gerais (MG)', 'Rio de Janeiro (RJ)', 'São Paulo (SP)'],
+    'Sul': ['Paraná (PR)', 'Rio Grande do Sul (RS)', 'Santa Catarina (SC)'],
+}
+
+
+# Índice de bitsets: para cada valor de cada filtro, as linhas que têm esse valor
+# (um bit por respondente, empacotado com np.packbits). Qualquer combinação da
+# barra lateral vira uma sequência de OR dentro do filtro e AND entre filtros.
+class IndiceFiltros:
+    def __init__(self, pesquisa):
+        self.linhas = len(pesquisa)
+        self.bitsets = {}
+
+        for dimensao, coluna in COLUNAS_FILTRO.items():
+            serie = pesquisa[coluna].astype('category')
+            codigos = serie.cat.codes.to_numpy()
+            self.bitsets[dimensao] = {
+                str(valor): np.packbits(codigos == codigo)
+                for codigo, valor in enumerate(serie.cat.categories)
+            }
+
+        idade = pesquisa['PERG.5'].to_numpy()
+        self.bitsets['idade'] = {rotulo: np.packbits(regra(idade)) for rotulo, regra in FAIXAS_IDADE.items()}
+
+        for bitsets in self.bitsets.values():
+            for bits in bitsets.values():
+                bits.setflags(write=False)
+
+    def _unir(self, lista):
+        if not lista:
+            return np.zeros((self.linhas + 7) // 8, dtype=np.uint8)
+        return np.bitwise_or.reduce(lista)
+
+    # Todas as linhas selecionadas
+    def todos(self):
+        return np.packbits(np.ones(self.linhas, dtype=bool))
+
+    # Bitset das linhas com qualquer um dos valores escolhidos na dimensão (sempre uma cópia nova)
+    def bits(self, dimensao, valores):
+        bitsets = self.bitsets[dimensao]
+        return self._unir([bitsets[v] for v in valores if v in bitsets]).copy()
+
+    # Valores da dimensão presentes nas linhas selecionadas
+    def valores(self, dimensao, selecao=None):
+        bitsets = self.bitsets[dimensao]
+        if selecao is None:
+            return list(bitsets)
+        return [valor for valor, bits in bitsets.items() if np.bitwise_and(bits, selecao).any()]
+
+    # Converte o bitset em máscara booleana de linhas
+    def mascara(self, selecao):
+        return np.unpackbits(selecao, count=self.linhas).view(bool)
+
+    def contar(self, selecao):
+        return int(np.unpackbits(selecao, count=self.linhas).sum())
+
+
+# Índice construído uma vez por versão dos dados e compartilhado entre sessões
+@cache_versao
+def _construir_indice(versao):
+    return IndiceFiltros(carregar_pesquisa(COLUNAS_INDICE))
+
+
+def indice_filtros():
+    return _construir_indice(versao_dados())
@@ -0,0 +1,452 @@
+import hashlib
+import json
+import logging
+
+import numpy as np
+import pandas as pd
+import plotly.colors
+import plotly.graph_objects as go
+import streamlit as st
+
+from painel.bootstrap import intervalos_percentis
+from painel.cache import CacheLRU
+from painel.cubo import contar_codigos, cubo_respostas
+from painel.dados import cache_versao, versao_ativa, versao_dados
+from painel.instrumentacao import etapa, medicao_atual
+from painel.multipla import respostas_multiplas
+
+# Versão do Streamlit em que a mensagem PlotlyChart montada à mão (exibir_figura) foi
+# conferida; é a fixada em requirements.txt. Em outra versão as figuras passam pelo
+# st.plotly_chart público.
+VERSAO_STREAMLIT_FIGURA = '1.27.2'
+
+try:
+    from streamlit.proto.PlotlyChart_pb2 import PlotlyChart as PlotlyChartProto
+except ImportError:
+    PlotlyChartProto = None
+if st.__version__ != VERSAO_STREAMLIT_FIGURA:
+    PlotlyChartProto = None
+
+logger = logging.getLogger(__name__)
+
+# Gráficos descritos como dicionários. Chaves aceitas:
+#   pergunta      coluna da pesquisa (obrigatória)
+#   colunas       várias colunas somadas como uma só pergunta (ex.: PERG.23 e PERG.24)
+#   tipo          'barras' (porcentagem, padrão) ou 'rosca'
+#   titulo        título do gráfico
+#   multipla      True para perguntas de múltipla escolha (porcentagem sobre os respondentes)
+#   renomear      dicionário resposta -> rótulo; rótulo None descarta a resposta
+#   faixas        (limites, rótulos) para agrupar respostas numéricas com pd.cut
+#   maiores       mantém só as N respostas mais frequentes; as demais vão para `outros`
+#   categorias    lista de rótulos mantidos; os demais vão para `outros`
+#   outros        rótulo das respostas fora da lista (padrão 'Outros'; None descarta)
+#   sem_resposta  rótulo para quem não respondeu (padrão: não entra no gráfico)
+#   ordem         'valor' (maior primeiro, padrão) ou 'categorias' (ordem da lista/faixas)
+#   cores         dicionário rótulo -> cor, ou lista de cores atribuídas na ordem dos rótulos
+
+# Cores usadas quando o gráfico não define as suas
+CORES_PADRAO = plotly.colors.qualitative.Plotly
+
+# Legenda horizontal abaixo do gráfico, comum a todas as páginas
+LEGENDA = dict(orientation="h", yanchor="bottom", y=-0.3, xanchor="center", x=0.5)
+
+# Limite de memória das figuras já serializadas, somando todas as sessões
+LIMITE_CACHE_FIGURAS = 64 * 1024 * 1024
+
+# Limite de memória e validade (segundos) das contagens já calculadas
+LIMITE_CACHE_AGREGACOES = 16 * 1024 * 1024
+VALIDADE_AGREGACOES = 60 * 60
+
+# Intervalos de confiança de Wilson (95%) desenhados como barras de erro
+Z_CONFIANCA = 1.96
+
+# Acima deste tamanho de recorte os intervalos de Wilson já bastam e o bootstrap não é usado
+LIMITE_BOOTSTRAP = 50_000
+
+# Gráficos com menos respostas que isso no recorte (tamanho efetivo, se ponderado) não
+# são desenhados: as porcentagens variariam demais para serem lidas como resultado
+MINIMO_RESPOSTAS = 30
+
+# Função para listar as colunas da pesquisa que os gráficos leem do recorte (o manifesto
+# de colunas da página). Múltipla escolha usa as incidências, não a coluna.
+def colunas_pagina(graficos):
+    colunas = []
+    for grafico in graficos:
+        if not grafico.get('multipla'):
+            colunas += grafico.get('colunas', [grafico['pergunta']])
+    return list(dict.fromkeys(colunas))
+
+
+# Chaves da descrição do gráfico que mudam as contagens (as demais só mudam o desenho)
+CHAVES_AGREGACAO = ['pergunta', 'colunas', 'multipla', 'renomear', 'faixas', 'maiores',
+                    'categorias', 'outros', 'sem_resposta']
+
+
+# Função para montar o mapa de cada coluna: código da categoria no cubo -> posição do
+# rótulo no gráfico (-1 descarta a resposta). Montado uma vez por gráfico e versão dos
+# dados; depois disso, agrupar em "Outros" é só um bincount sobre os códigos.
+@cache_versao
+def _mapa_rotulos(chave, versao, _grafico):
+    cubo = cubo_respostas()
+    outros = _grafico.get('outros', 'Outros')
+    mantidos = None if 'maiores' in _grafico else _grafico.get('categorias')
+    rotulos = []
+    mapas = {}
+    for coluna in _grafico.get('colunas', [_grafico['pergunta']]):
+        categorias = cubo.categorias(coluna)
+        nomes = pd.Series(categorias, dtype=object)
+
+        if 'renomear' in _grafico:
+            renomear = _grafico['renomear']
+            nomes = nomes.map(lambda valor: renomear.get(valor, valor))
+
+        if 'faixas' in _grafico:
+            limites, faixas = _grafico['faixas']
+            nomes = pd.Series(pd.cut(categorias, bins=limites, labels=faixas).astype(object))
+
+        if mantidos is not None:
+            nomes = nomes.where(nomes.isin(mantidos) | nomes.isna(), outros)
+
+        mapa = np.full(len(categorias), -1, dtype=np.int64)
+        for codigo, nome in enumerate(nomes):
+            if pd.isna(nome):
+                continue
+            if nome not in rotulos:
+                rotulos.append(nome)
+            mapa[codigo] = rotulos.index(nome)
+        mapas[coluna] = mapa
+    return rotulos, mapas
+
+
+def _chave_mapa(grafico):
+    return json.dumps({k: grafico[k] for k in CHAVES_AGREGACAO if k in grafico},
+                      sort_keys=True, ensure_ascii=False, default=repr)
+
+
+# Função para ordenar os rótulos conforme a descrição do gráfico
+def ordenar(contagem, grafico):
+    if grafico.get('ordem') == 'categorias':
+        ordem = grafico['faixas'][1] if 'faixas' in grafico else grafico['categorias']
+        return contagem.reindex([r for r in ordem if r in contagem.index])
+    return contagem.sort_values(ascending=False, kind='stable')
+
+
+# Função para contar as respostas de um gráfico no recorte filtrado
+def contar(grafico, recorte):
+    # Contagens inteiras, ou ponderadas (float) quando o recorte traz pesos
+    tipo = np.int64 if recorte.pesos is None else np.float64
+    if grafico.get('multipla'):
+        outros = grafico.get('outros', 'Outros')
+        pesos = None if recorte.pesos is None else recorte.pesos.por_linha
+        contador = respostas_multiplas(grafico['pergunta']).contar_categorias(
+            recorte.mascara(), grafico['categorias'], outros, pesos)
+        return pd.Series(contador, dtype=tipo), recorte.peso_total()
+
+    rotulos, mapas = _mapa_rotulos(_chave_mapa(grafico), versao_dados(), grafico)
+    contagem = np.zeros(len(rotulos), dtype=tipo)
+    respondidas = 0
+    for coluna, mapa in mapas.items():
+        por_categoria = contar_codigos(recorte, coluna)
+        respondidas += por_categoria.sum()
+        validos = mapa >= 0
+        contagem += np.bincount(mapa[validos], weights=por_categoria[validos],
+                                minlength=len(rotulos)).astype(tipo)
+    contagem = pd.Series(contagem, index=pd.Index(rotulos, dtype=object))
+
+    if 'maiores' in grafico:
+        # As N respostas mais frequentes ficam; as demais somam em `outros`
+        ordem = contagem.sort_values(ascending=False, kind='stable')
+        mantidos, resto = ordem.iloc[:grafico['maiores']], ordem.iloc[grafico['maiores']:]
+        outros = grafico.get('outros', 'Outros')
+        contagem = mantidos[mantidos > 0]
+        if outros is not None and resto.sum():
+            contagem = contagem.add(pd.Series({outros: resto.sum()}), fill_value=0)
+
+    if 'sem_resposta' in grafico:
+        faltantes = recorte.peso_total() * len(mapas) - respondidas
+        contagem = contagem.add(pd.Series({grafico['sem_resposta']: faltantes}), fill_value=0)
+    contagem = contagem[contagem > 0].astype(tipo)
+    return contagem, contagem.sum().item()
+
+
+# Gráficos cujos intervalos vêm do banco de reamostragens: múltipla escolha, várias colunas
+# somadas e percentuais ponderados, em que as respostas não são um sorteio binomial simples
+def usa_bootstrap(grafico, recorte):
+    especial = grafico.get('multipla') or 'colunas' in grafico or recorte.pesos is not None
+    return bool(especial) and 0 < len(recorte) <= LIMITE_BOOTSTRAP
+
+
+# Função para montar os indicadores de cada linha do recorte (linhas x rótulos da
+# contagem): quanto a linha soma em cada barra. Devolve também a base por linha da
+# porcentagem (None quando a base é a soma das barras).
+def indicadores_linhas(grafico, recorte, rotulos_contagem):
+    posicao = {rotulo: i for i, rotulo in enumerate(rotulos_contagem)}
+    indicadores = np.zeros((len(recorte), len(rotulos_contagem)), dtype=np.float32)
+
+    if grafico.get('multipla'):
+        categorias = list(grafico['categorias'])
+        destino = np.array([posicao.get(c, -1) for c in categorias + [grafico.get('outros', 'Outros')]])
+        linhas, categoria = respostas_multiplas(grafico['pergunta']).escolhas_categorias(
+            recorte.mascara(), categorias)
+        alvo = destino[categoria]
+        validos = alvo >= 0
+        np.add.at(indicadores, (np.searchsorted(recorte.linhas, linhas[validos]), alvo[validos]), 1)
+        return indicadores, np.ones(len(recorte), dtype=np.float32)
+
+    rotulos, mapas = _mapa_rotulos(_chave_mapa(grafico), versao_dados(), grafico)
+    # Rótulo do gráfico -> barra da contagem; os que ficaram fora das N maiores vão para `outros`
+    reserva = posicao.get(grafico.get('outros', 'Outros'), -1) if 'maiores' in grafico else -1
+    destino = np.array([posicao.get(r, reserva) for r in rotulos] + [-1])
+    sem_resposta = posicao.get(grafico['sem_resposta'], -1) if 'sem_resposta' in grafico else -1
+    cubo = cubo_respostas()
+    for coluna, mapa in mapas.items():
+        codigos = recorte.codigos(coluna, cubo.categorias(coluna))
+        respondida = codigos >= 0
+        alvo = np.full(len(recorte), sem_resposta)
+        alvo[respondida] = destino[mapa[codigos[respondida]]]
+        validos = np.flatnonzero(alvo >= 0)
+        np.add.at(indicadores, (validos, alvo[validos]), 1)
+    return indicadores, None
+
+
+# Função para calcular os intervalos de confiança bootstrap das barras do gráfico
+# (DataFrame com as proporções inferior e superior por rótulo), ou None quando os
+# intervalos de Wilson são usados
+def intervalos_bootstrap(grafico, recorte, contagem):
+    if not usa_bootstrap(grafico, recorte) or contagem.empty:
+        return None
+    indicadores, denominador = indicadores_linhas(grafico, recorte, contagem.index)
+    pesos = None if recorte.pesos is None else recorte.pesos.por_linha
+    inferior, superior = intervalos_percentis(indicadores, recorte.linhas, pesos, denominador)
+    return pd.DataFrame({'inferior': inferior, 'superior': superior}, index=contagem.index)
+
+
+# Rótulos possíveis do gráfico, na ordem usada para distribuir uma lista de cores
+def _rotulos_possiveis(grafico):
+    if grafico.get('multipla'):
+        return list(grafico['categorias']) + [grafico.get('outros', 'Outros')]
+
+    rotulos, _ = _mapa_rotulos(_chave_mapa(grafico), versao_dados(), grafico)
+    if 'maiores' in grafico:
+        outros = grafico.get('outros', 'Outros')
+        rotulos = rotulos[:grafico['maiores']] + ([outros] if outros is not None else [])
+    rotulos = list(ordenar(pd.Series(1, index=pd.Index(rotulos, dtype=object)), grafico).index)
+    if 'sem_resposta' in grafico and grafico['sem_resposta'] not in rotulos:
+        rotulos.append(grafico['sem_resposta'])
+    return rotulos
+
+
+# Função para escolher a cor de cada rótulo exibido; rótulos sem cor definida
+# recebem as cores padrão na ordem em que aparecem
+def escolher_cores(grafico, rotulos):
+    cores = grafico.get('cores', CORES_PADRAO)
+    if not isinstance(cores, dict):
+        cores = {rotulo: cores[i % len(cores)] for i, rotulo in enumerate(_rotulos_possiveis(grafico))}
+    return [cores.get(rotulo, CORES_PADRAO[i % len(CORES_PADRAO)]) for i, rotulo in enumerate(rotulos)]
+
+
+# Intervalos de Wilson de todas as proporções `p` de uma vez, com `n` respostas na base
+def intervalo_wilson(p, n, z=Z_CONFIANCA):
+    p = np.asarray(p, dtype=np.float64)
+    denominador = 1 + z ** 2 / n
+    centro = (p + z ** 2 / (2 * n)) / denominador
+    margem = z * np.sqrt(p * (1 - p) / n + z ** 2 / (4 * n ** 2)) / denominador
+    return np.clip(centro - margem, 0, 1), np.clip(centro + margem, 0, 1)
+
+
+# Texto da base do gráfico; ponderado, mostra o tamanho efetivo da amostra
+def _texto_base(total, efeito_desenho):
+    if efeito_desenho == 1.0:
+        return f'Base: {total:.0f} respostas'
+    return f'Base ponderada: {total:.0f} respostas (tamanho efetivo ≈ {total / efeito_desenho:.0f})'
+
+
+# Figura no lugar de um gráfico com respostas de menos no recorte
+def _figura_suprimida(grafico, n):
+    fig = go.Figure()
+    fig.add_annotation(
+        text=f'Só {n:.0f} respostas neste recorte (mínimo de {MINIMO_RESPOSTAS}).<br>'
+             'Amplie os filtros para ver este gráfico.',
+        x=0.5, y=0.5, xref='paper', yref='paper', showarrow=False, font=dict(size=14),
+    )
+    fig.update_layout(title=grafico.get('titulo'), xaxis=dict(visible=False), yaxis=dict(visible=False))
+    return fig
+
+
+# Função para montar a figura do gráfico a partir das contagens. `efeito_desenho`
+# (Recorte.efeito_desenho) converte a base ponderada no tamanho efetivo da amostra;
+# `intervalos` (intervalos_bootstrap) substitui os intervalos de Wilson.
+def montar_figura(grafico, contagem, total, efeito_desenho=1.0, intervalos=None):
+    n = total / efeito_desenho
+    if n < MINIMO_RESPOSTAS:
+        return _figura_suprimida(grafico, n)
+
+    contagem = ordenar(contagem[contagem > 0], grafico)
+    cores = escolher_cores(grafico, contagem.index)
+    rotulos = [str(r) for r in contagem.index]
+    proporcao = contagem.to_numpy() / total
+    if intervalos is None:
+        inferior, superior = intervalo_wilson(proporcao, n)
+    else:
+        inferior, superior = intervalos.reindex(contagem.index).to_numpy().T
+    # Percentis do bootstrap podem não conter a estimativa por pouco; a barra de erro não fica negativa
+    inferior, superior = np.minimum(inferior, proporcao), np.maximum(superior, proporcao)
+    intervalos = np.column_stack([inferior, superior]) * 100
+
+    if grafico.get('tipo') == 'rosca':
+        fig = go.Figure(go.Pie(
+            labels=rotulos, values=contagem.to_numpy(), hole=0.4, textinfo='percent',
+            marker=dict(colors=cores), customdata=intervalos,
+            hovertemplate='%{label}: %{percent}<br>IC 95%: %{customdata[0][0]:.1f}% a '
+                          '%{customdata[0][1]:.1f}%<extra></extra>',
+        ))
+        fig.update_layout(title=grafico.get('titulo'), uniformtext_minsize=8, uniformtext_mode='hide',
+                          legend=LEGENDA, annotations=[dict(
+                              text=_texto_base(total, efeito_desenho), x=0.5, y=-0.15,
+                              xref='paper', yref='paper', showarrow=False)])
+        return fig
+
+    porcentagem = proporcao * 100
+    fig = go.Figure([
+        go.Bar(x=[rotulo], y=[valor], text=[valor], name=rotulo, marker_color=cor,
+               texttemplate='%{text:.2f}%', textposition='outside',
+               error_y=dict(type='data', symmetric=False, array=[fim - valor],
+                            arrayminus=[valor - inicio], color='#555555', thickness=1.5, width=4),
+               customdata=[[inicio, fim]],
+               hovertemplate=f'{rotulo}: %{{y:.2f}}%<br>IC 95%: %{{customdata[0]:.1f}}% a '
+                             '%{customdata[1]:.1f}%<extra></extra>')
+        for rotulo, cor, valor, (inicio, fim) in zip(rotulos, cores, porcentagem, intervalos)
+    ])
+    fig.update_layout(title=grafico.get('titulo'), uniformtext_minsize=8, uniformtext_mode='hide',
+                      yaxis_title="Porcentagem (%)",
+                      xaxis_title=_texto_base(total, efeito_desenho),
+                      legend=LEGENDA,
+                      xaxis=dict(tickmode='array', tickvals=[]))
+    return fig
+
+
+# Cache das figuras em JSON, compartilhado por todas as sessões do processo
+@st.cache_resource
+def cache_figuras():
+    return CacheLRU(LIMITE_CACHE_FIGURAS)
+
+
+# Cache das contagens de cada gráfico, compartilhado por todas as sessões do processo
+@st.cache_resource
+def cache_agregacoes():
+    return CacheLRU(LIMITE_CACHE_AGREGACOES, ttl=VALIDADE_AGREGACOES)
+
+
+# Contadores dos caches, para acompanhar a taxa de acerto e dimensionar os limites
+def metricas_caches():
+    return {'figuras': cache_figuras().metricas(), 'agregacoes': cache_agregacoes().metricas()}
+
+
+# Chave de cache: hash da descrição, do recorte e da versão dos dados. O recorte entra
+# como a máscara de células do cubo, então seleções equivalentes na barra lateral
+# (ex.: "Brasil" ou todos os estados marcados um a um) caem na mesma chave.
+def chave_cache(descricao, celulas, versao):
+    conteudo = hashlib.sha256()
+    conteudo.update(json.dumps(descricao, sort_keys=True, ensure_ascii=False, default=repr).encode())
+    conteudo.update(np.packbits(celulas).tobytes())
+    conteudo.update(versao.encode())
+    return conteudo.hexdigest()
+
+
+def _tamanho_contagem(resultado):
+    contagem, _ = resultado
+    return int(contagem.memory_usage(index=True, deep=True))
+
+
+# Função para exibir uma figura já serializada sem reconstruir o objeto do Plotly.
+# Monta a mensagem PlotlyChart à mão e usa st._main._enqueue, que é interno do Streamlit,
+# só na versão VERSAO_STREAMLIT_FIGURA. Em outra versão, ou se esse caminho falhar, a
+# figura passa pelo st.plotly_chart público (mais lento, pois refaz a figura a partir
+# do JSON) e o caminho interno fica desligado até o processo reiniciar.
+def exibir_figura(figura_json):
+    global PlotlyChartProto
+    if PlotlyChartProto is not None:
+        try:
+            proto = PlotlyChartProto()
+            proto.use_container_width = False
+            proto.figure.spec = figura_json
+            proto.figure.config = json.dumps({'showLink': False, 'linkText': False})
+            proto.theme = 'streamlit'
+            st._main._enqueue('plotly_chart', proto)
+            return
+        except Exception:
+            logger.exception('Falha ao exibir a figura pela mensagem PlotlyChart; usando st.plotly_chart')
+            PlotlyChartProto = None
+    st.plotly_chart(json.loads(figura_json))
+
+
+# Função para exibir todos os gráficos de uma página sobre o mesmo recorte filtrado
+def desenhar_graficos(graficos, recorte):
+    figuras = cache_figuras()
+    agregacoes = cache_agregacoes()
+    # Depois da troca do snapshot, as entradas da versão anterior saem dos caches
+    figuras.renovar(versao_ativa())
+    agregacoes.renovar(versao_ativa())
+    celulas = recorte.celulas
+    versao = versao_dados()
+    if recorte.pesos is not None:
+        # Percentuais ponderados não dividem o cache com os da amostra
+        versao = f'{versao}|pesos-{recorte.pesos.assinatura}'
+    efeito = recorte.efeito_desenho()
+    medicao = medicao_atual()
+
+    for grafico in graficos:
+        with etapa(f"gráfico: {grafico.get('titulo') or grafico['pergunta']}"):
+            if celulas is None:
+                _desenhar_sem_cache(grafico, recorte, efeito, medicao)
+                continue
+
+            with etapa('cache de figuras'):
+                chave = chave_cache(grafico, celulas, versao)
+                figura = figuras.obter(chave)
+            if medicao is not None:
+                medicao.anotar('figuras_acertos' if figura is not None else 'figuras_falhas')
+            if figura is None:
+                dados_grafico = {k: grafico[k] for k in CHAVES_AGREGACAO if k in grafico}
+                with etapa('agregação', len(recorte)):
+                    contagem, total = agregacoes.obter_ou_calcular(
+                        chave_cache(dados_grafico, celulas, versao),
+                        lambda: _contar_medindo(grafico, recorte, medicao),
+                        _tamanho_contagem,
+                    )
+                if medicao is not None:
+                    medicao.anotar('agregacoes_consultas')
+                with etapa('incerteza'):
+                    intervalos = intervalos_bootstrap(grafico, recorte, contagem)
+                with etapa('figura'):
+                    figura = montar_figura(grafico, contagem, total, efeito, intervalos)
+                with etapa('serialização'):
+                    figura = figura.to_json()
+                figuras.guardar(chave, figura, len(figura.encode()))
+            if medicao is not None:
+                medicao.anotar('bytes_figuras', len(figura.encode()))
+            with etapa('exibição'):
+                exibir_figura(figura)
+
+
+# Contagem feita de fato (falha do cache de agregações), anotada na medição
+def _contar_medindo(grafico, recorte, medicao):
+    if medicao is not None:
+        medicao.anotar('agregacoes_falhas')
+    return contar(grafico, recorte)
+
+
+# Gráfico de um recorte sem células do cubo: contado e desenhado sem passar pelos caches
+def _desenhar_sem_cache(grafico, recorte, efeito, medicao):
+    with etapa('agregação', len(recorte)):
+        contagem, total = contar(grafico, recorte)
+    with etapa('incerteza'):
+        intervalos = intervalos_bootstrap(grafico, recorte, contagem)
+    with etapa('figura'):
+        figura = montar_figura(grafico, contagem, total, efeito, intervalos)
+    with etapa('serialização'):
+        figura = figura.to_json()
+    if medicao is not None:
+        medicao.anotar('bytes_figuras', len(figura.encode()))
+    with etapa('exibição'):
+        exibir_figura(figura)
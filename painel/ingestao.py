@@ -0,0 +1,387 @@
+# Ingestão da pesquisa: lê a planilha (ou a exportação em CSV) uma única vez,
+# aplica a limpeza que as páginas repetiam e grava um snapshot binário versionado.
+#
+# Com --incremental, só as respostas com data (PERG.1) posterior à marca d'água do
+# snapshot atual são limpas e gravadas, como um segmento novo e imutável anexado ao
+# manifesto; os arquivos já gravados não mudam. Cada segmento traz o próprio cubo de
+# contagens, somado ao do snapshot na carga, então o custo da atualização acompanha o
+# tamanho do lote. Ao juntar MAXIMO_SEGMENTOS segmentos (ou com --compactar), snapshot e
+# segmentos são regravados como um snapshot único.
+#
+# Uso:
+#   python -m painel.ingestao "BD COFECI - sem analises.xlsx"
+#   python -m painel.ingestao cofeci.csv
+#   python -m painel.ingestao cofeci2.csv --incremental
+#   python -m painel.ingestao --compactar
+import argparse
+import hashlib
+import json
+import os
+import tempfile
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+import pyarrow.feather as feather
+
+from painel import dados
+from painel.bootstrap import gravar_banco
+from painel.filtros import COLUNAS_FILTRO, DIMENSOES_CUBO, FAIXAS_IDADE, codigos_faixa_idade
+
+# Aba da planilha com a base unificada da pesquisa
+ABA_PADRAO = 'Unif '
+
+# Segmentos acumulados que disparam a compactação na ingestão incremental
+MAXIMO_SEGMENTOS = 8
+
+# Faixa de idades consideradas válidas
+IDADE_MINIMA = 0
+IDADE_MAXIMA = 120
+
+
+# Função para ler a planilha ou o CSV exportado, com as colunas no padrão PERG.N
+def ler_origem(caminho, aba=ABA_PADRAO):
+    if caminho.lower().endswith('.csv'):
+        df = pd.read_csv(caminho)
+        return df.drop(columns=[c for c in df.columns if c.startswith('Unnamed')])
+
+    df = pd.read_excel(caminho, sheet_name=aba)
+    # As colunas da planilha são os enunciados das perguntas, na ordem do questionário
+    df.columns = [f'PERG.{i}' for i in range(1, df.shape[1] + 1)]
+    return df
+
+
+def _texto(valor):
+    # O Excel guarda algumas respostas como número (ex.: quantidade de filhos)
+    if isinstance(valor, float) and valor.is_integer():
+        return str(int(valor))
+    return str(valor)
+
+
+# Função para aplicar a limpeza comum a todas as páginas
+def limpar(df):
+    df = df.copy()
+
+    # Remove espaços nas pontas das respostas livres; resposta vazia vira nula
+    for coluna in df.columns:
+        if df[coluna].dtype == object:
+            # Sem o acessor .str: num lote pequeno a coluna pode vir toda vazia (float64)
+            serie = df[coluna].map(lambda valor: _texto(valor).strip(), na_action='ignore').astype(object)
+            df[coluna] = serie.mask(serie == '')
+
+    # Idade: extrai apenas os dígitos ("46 Anos " -> 46) e descarta idades inválidas
+    idade = df['PERG.5'].astype(str).str.extract(r'(\d+)', expand=False)
+    idade = pd.to_numeric(idade, errors='coerce')
+    df = df[idade.gt(IDADE_MINIMA) & idade.le(IDADE_MAXIMA)].copy()
+    df['PERG.5'] = idade[df.index].astype('int16')
+    # Faixa etária pré-calculada: início da década da idade (46 -> 40)
+    df['FAIXA_ETARIA'] = (df['PERG.5'] // 10 * 10).astype('int16')
+
+    df['PERG.1'] = pd.to_datetime(df['PERG.1'], errors='coerce')
+    return df.reset_index(drop=True)
+
+
+# Função para converter as colunas da pesquisa para tipos compactos
+def tipar_colunas(df):
+    for coluna in df.columns:
+        serie = df[coluna]
+        if serie.dtype != object:
+            continue
+        # Colunas com muitas respostas distintas (nomes, comentários) continuam como texto
+        if serie.nunique() <= dados.LIMITE_CATEGORIAS * len(serie):
+            df[coluna] = serie.astype('category')
+    return df
+
+
+# Função para separar as respostas de múltipla escolha: uma linha por (pergunta, respondente, opção)
+def explodir_multipla(df):
+    partes = []
+    for pergunta in dados.PERGUNTAS_MULTIPLA:
+        opcoes = df[pergunta].dropna().astype(str).str.split(',').explode().str.strip()
+        opcoes = opcoes[opcoes != '']
+        partes.append(pd.DataFrame({
+            'pergunta': pergunta,
+            'linha': opcoes.index.to_numpy(dtype='int32'),
+            'opcao': opcoes.to_numpy(),
+        }).drop_duplicates())
+
+    longo = pd.concat(partes, ignore_index=True)
+    longo['pergunta'] = longo['pergunta'].astype('category')
+    longo['opcao'] = longo['opcao'].astype('category')
+    return longo
+
+
+# Função para montar o cubo de contagens: para cada pergunta, quantos respondentes
+# deram cada resposta em cada combinação de estado, capital/interior, faixa de idade,
+# escolaridade e sexo. Só as células com contagem são guardadas (celula, categoria, contagem).
+def construir_cubo(df, multipla):
+    cubo = {}
+    codigos_dimensoes = []
+    for dimensao in DIMENSOES_CUBO:
+        if dimensao == 'idade':
+            rotulos = list(FAIXAS_IDADE) + ['35 anos']
+            codigos = codigos_faixa_idade(df['PERG.5'])
+        else:
+            serie = df[COLUNAS_FILTRO[dimensao]].astype('category')
+            rotulos = [str(valor) for valor in serie.cat.categories]
+            # Última posição do eixo: sem resposta
+            codigos = np.where(serie.cat.codes < 0, len(rotulos), serie.cat.codes)
+        cubo[f'dimensao|{dimensao}'] = np.array(rotulos, dtype=str)
+        codigos_dimensoes.append(codigos)
+
+    forma = tuple(len(cubo[f'dimensao|{d}']) + (d != 'idade') for d in DIMENSOES_CUBO)
+    celulas = np.ravel_multi_index(codigos_dimensoes, forma)
+    cubo['forma'] = np.array(forma)
+    cubo['respondentes'] = np.bincount(celulas, minlength=int(np.prod(forma))).astype(np.int32)
+
+    def guardar(pergunta, categorias, linhas, codigos):
+        chave = celulas[linhas].astype(np.int64) * len(categorias) + codigos
+        chave, contagem = np.unique(chave, return_counts=True)
+        categorias = np.asarray(categorias)
+        cubo[f'{pergunta}|categorias'] = categorias.astype(str) if categorias.dtype == object else categorias
+        cubo[f'{pergunta}|celula'] = (chave // len(categorias)).astype(np.int32)
+        cubo[f'{pergunta}|categoria'] = (chave % len(categorias)).astype(np.int32)
+        cubo[f'{pergunta}|contagem'] = contagem.astype(np.int32)
+
+    for pergunta in df.columns:
+        serie = df[pergunta]
+        if pergunta in dados.PERGUNTAS_MULTIPLA or not (
+                isinstance(serie.dtype, pd.CategoricalDtype) or pd.api.types.is_numeric_dtype(serie)):
+            continue
+        serie = serie.astype('category')
+        codigos = serie.cat.codes.to_numpy()
+        respondidas = np.flatnonzero(codigos >= 0)
+        guardar(pergunta, serie.cat.categories, respondidas, codigos[respondidas])
+
+    for pergunta, grupo in multipla.groupby('pergunta', observed=True):
+        opcao = grupo['opcao'].cat.remove_unused_categories()
+        guardar(pergunta, opcao.cat.categories, grupo['linha'].to_numpy(), opcao.cat.codes.to_numpy())
+
+    return cubo
+
+
+def _gravar_arrow(df, diretorio):
+    descritor, temporario = tempfile.mkstemp(suffix='.arrow', dir=diretorio)
+    os.close(descritor)
+    feather.write_feather(df, temporario, compression='uncompressed')
+    os.chmod(temporario, 0o644)
+    return temporario
+
+
+def _gravar_cubo(cubo, nome, diretorio):
+    descritor, temporario = tempfile.mkstemp(suffix='.npz', dir=diretorio)
+    with os.fdopen(descritor, 'wb') as arquivo:
+        np.savez_compressed(arquivo, **cubo)
+    os.chmod(temporario, 0o644)
+    os.replace(temporario, os.path.join(diretorio, nome))
+
+
+# Troca atômica: quem estiver lendo vê o manifesto antigo ou o novo, nunca um parcial
+def _gravar_manifesto(manifesto, diretorio):
+    descritor, temporario = tempfile.mkstemp(suffix='.json', dir=diretorio)
+    with os.fdopen(descritor, 'w', encoding='utf-8') as arquivo:
+        json.dump(manifesto, arquivo, ensure_ascii=False, indent=2)
+    os.chmod(temporario, 0o644)
+    os.replace(temporario, os.path.join(diretorio, dados.MANIFESTO))
+
+
+# Data da resposta mais recente, gravada no manifesto como marca d'água da ingestão incremental
+def _marca_dagua(datas):
+    marca = datas.max()
+    return None if pd.isna(marca) else marca.isoformat()
+
+
+# Função para gravar o snapshot com o hash do conteúdo no nome e atualizar o manifesto
+def gravar_snapshot(df, origem, diretorio=dados.DIRETORIO_SNAPSHOTS):
+    os.makedirs(diretorio, exist_ok=True)
+
+    temporario = _gravar_arrow(df, diretorio)
+    with open(temporario, 'rb') as arquivo:
+        conteudo = hashlib.sha256(arquivo.read()).hexdigest()
+    versao = f'v{dados.VERSAO_SNAPSHOT}-{conteudo[:12]}'
+    nome = f'cofeci-{versao}.arrow'
+    os.replace(temporario, os.path.join(diretorio, nome))
+
+    # Respostas de múltipla escolha separadas uma única vez, derivadas do mesmo conteúdo
+    multipla = explodir_multipla(df)
+    nome_multipla = f'cofeci-{versao}-multipla.arrow'
+    os.replace(_gravar_arrow(multipla, diretorio), os.path.join(diretorio, nome_multipla))
+
+    # Cubo de contagens pré-agregadas por dimensão de filtro
+    nome_cubo = f'cofeci-{versao}-cubo.npz'
+    _gravar_cubo(construir_cubo(df, multipla), nome_cubo, diretorio)
+
+    # Banco de reamostragens bootstrap, para os intervalos de confiança das páginas
+    nome_bootstrap = gravar_banco(len(df), nome, diretorio)
+
+    manifesto = {
+        'versao': versao,
+        'arquivo': nome,
+        'multipla': nome_multipla,
+        'cubo': nome_cubo,
+        'bootstrap': nome_bootstrap,
+        'sha256': conteudo,
+        'origem': os.path.basename(origem),
+        'linhas': len(df),
+        'marca_dagua': _marca_dagua(df['PERG.1']),
+        'segmentos': [],
+        'gerado_em': datetime.now().isoformat(timespec='seconds'),
+    }
+    _gravar_manifesto(manifesto, diretorio)
+    return manifesto
+
+
+# Função que executa a ingestão completa
+def ingerir(origem, aba=ABA_PADRAO, diretorio=dados.DIRETORIO_SNAPSHOTS):
+    df = tipar_colunas(limpar(ler_origem(origem, aba)))
+    return gravar_snapshot(df, origem, diretorio)
+
+
+# Função para converter as respostas novas para os tipos das colunas do snapshot; as
+# categorias de cada segmento são unidas às do snapshot na leitura
+def conformar(df, tipos):
+    colunas = {}
+    for coluna, tipo in tipos.items():
+        serie = df[coluna] if coluna in df else pd.Series(None, index=df.index, dtype=object)
+        if isinstance(tipo, pd.CategoricalDtype) or tipo == object:
+            serie = serie.map(_texto, na_action='ignore').astype(object)
+            if isinstance(tipo, pd.CategoricalDtype):
+                serie = serie.astype(pd.CategoricalDtype(pd.Index(serie.dropna().unique(), dtype=object)))
+        elif pd.api.types.is_datetime64_any_dtype(tipo):
+            serie = pd.to_datetime(serie, errors='coerce')
+        else:
+            serie = pd.to_numeric(serie, errors='coerce')
+            if not (pd.api.types.is_integer_dtype(tipo) and serie.isna().any()):
+                serie = serie.astype(tipo)
+        colunas[coluna] = serie
+    return pd.DataFrame(colunas).reset_index(drop=True)
+
+
+# Função para anexar ao snapshot atual as respostas com PERG.1 posterior à marca d'água,
+# como um segmento imutável (dados, múltipla escolha e banco bootstrap próprios)
+def anexar_segmento(origem, aba=ABA_PADRAO, diretorio=dados.DIRETORIO_SNAPSHOTS):
+    manifesto = dados.ler_manifesto(diretorio)
+    if manifesto is None:
+        return ingerir(origem, aba, diretorio)
+
+    tipos = feather.read_table(os.path.join(diretorio, manifesto['arquivo']),
+                               memory_map=True).slice(0, 0).to_pandas().dtypes
+    gravadas = dados.ler_snapshot(manifesto, diretorio, colunas=['PERG.1'])['PERG.1']
+    marca = manifesto.get('marca_dagua')
+    if 'marca_dagua' not in manifesto:
+        marca = _marca_dagua(gravadas)
+
+    # Só as linhas novas passam pela limpeza. Respostas sem data válida e as com a data
+    # exata da marca d'água ficam de fora (só entram numa ingestão completa); as
+    # quantidades vão no manifesto devolvido, em 'ignoradas'
+    bruta = ler_origem(origem, aba)
+    datas = pd.to_datetime(bruta['PERG.1'], errors='coerce')
+    novas = bruta[datas > pd.Timestamp(marca)] if marca is not None else bruta[datas.notna()]
+    # Descontadas as que o snapshot já tem (a ingestão completa mantém as sem data)
+    ignoradas = {'sem_data': max(int(datas.isna().sum()) - int(gravadas.isna().sum()), 0), 'na_marca_dagua': 0}
+    if marca is not None:
+        ignoradas['na_marca_dagua'] = max(int((datas == pd.Timestamp(marca)).sum())
+                                          - int((gravadas == pd.Timestamp(marca)).sum()), 0)
+    df = conformar(limpar(novas), tipos)
+    if df.empty:
+        return dict(manifesto, ignoradas=ignoradas)
+
+    temporario = _gravar_arrow(df, diretorio)
+    with open(temporario, 'rb') as arquivo:
+        conteudo = hashlib.sha256(arquivo.read()).hexdigest()
+    nome = f'cofeci-segmento-{conteudo[:12]}.arrow'
+    os.replace(temporario, os.path.join(diretorio, nome))
+
+    # Cubo só das respostas novas, com os próprios rótulos; somado ao do snapshot na carga
+    multipla = explodir_multipla(df)
+    nome_cubo = f'cofeci-segmento-{conteudo[:12]}-cubo.npz'
+    _gravar_cubo(construir_cubo(df, multipla), nome_cubo, diretorio)
+
+    # Linhas da múltipla escolha numeradas a partir do fim das partes anteriores
+    multipla['linha'] += manifesto['linhas']
+    nome_multipla = f'cofeci-segmento-{conteudo[:12]}-multipla.arrow'
+    os.replace(_gravar_arrow(multipla, diretorio), os.path.join(diretorio, nome_multipla))
+
+    segmento = {
+        'arquivo': nome,
+        'multipla': nome_multipla,
+        'cubo': nome_cubo,
+        'bootstrap': gravar_banco(len(df), nome, diretorio),
+        'sha256': conteudo,
+        'origem': os.path.basename(origem),
+        'linhas': len(df),
+        'marca_dagua': _marca_dagua(df['PERG.1']),
+        'gerado_em': datetime.now().isoformat(timespec='seconds'),
+    }
+    # A versão encadeia o conteúdo anterior com o do segmento
+    encadeado = hashlib.sha256((manifesto['sha256'] + conteudo).encode()).hexdigest()
+    versao = f'v{dados.VERSAO_SNAPSHOT}-{encadeado[:12]}'
+    novo = dict(manifesto, versao=versao, sha256=encadeado, linhas=manifesto['linhas'] + len(df),
+                marca_dagua=segmento['marca_dagua'],
+                segmentos=dados.segmentos(manifesto) + [segmento],
+                gerado_em=segmento['gerado_em'])
+    _gravar_manifesto(novo, diretorio)
+
+    if len(novo['segmentos']) >= MAXIMO_SEGMENTOS:
+        novo = compactar(diretorio)
+    return dict(novo, ignoradas=ignoradas)
+
+
+# Função para regravar o snapshot e seus segmentos como um snapshot único (cubo e banco
+# bootstrap refeitos sobre todas as linhas). Os arquivos antigos ficam no diretório, pois
+# servidores ainda na versão anterior podem estar lendo deles.
+def compactar(diretorio=dados.DIRETORIO_SNAPSHOTS):
+    manifesto = dados.ler_manifesto(diretorio)
+    if manifesto is None or not dados.segmentos(manifesto):
+        return manifesto
+    return gravar_snapshot(dados.ler_snapshot(manifesto, diretorio), manifesto['origem'], diretorio)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Gera o snapshot binário da pesquisa COFECI.')
+    parser.add_argument('origem', nargs='?', default=dados.ARQUIVO_CSV,
+                        help='planilha .xlsx ou exportação .csv (padrão: cofeci.csv)')
+    parser.add_argument('--aba', default=ABA_PADRAO, help='aba da planilha com a base unificada')
+    parser.add_argument('--saida', default=dados.DIRETORIO_SNAPSHOTS, help='diretório dos snapshots')
+    parser.add_argument('--incremental', action='store_true',
+                        help="anexa só as respostas posteriores à marca d'água do snapshot atual")
+    parser.add_argument('--compactar', action='store_true',
+                        help='regrava o snapshot atual e seus segmentos como um snapshot único')
+    args = parser.parse_args(argv)
+
+    if args.compactar:
+        manifesto = compactar(args.saida)
+        if manifesto is None:
+            print(f'Nenhum snapshot em {args.saida}')
+            return
+        print(f"Snapshot {manifesto['versao']} compactado: {manifesto['linhas']} respostas "
+              f"em {os.path.join(args.saida, manifesto['arquivo'])}")
+        return
+
+    anterior = dados.ler_manifesto(args.saida) if args.incremental else None
+    if anterior is None:
+        manifesto = ingerir(args.origem, args.aba, args.saida)
+    else:
+        manifesto = anexar_segmento(args.origem, args.aba, args.saida)
+        ignoradas = manifesto['ignoradas']
+        if ignoradas['sem_data'] or ignoradas['na_marca_dagua']:
+            print(f"Respostas ignoradas: {ignoradas['sem_data']} sem data válida em PERG.1 e "
+                  f"{ignoradas['na_marca_dagua']} com a data da marca d'água ({anterior.get('marca_dagua')}); "
+                  f"rode a ingestão completa para incluí-las")
+        if manifesto['versao'] == anterior['versao']:
+            print(f"Nenhuma resposta posterior a {manifesto.get('marca_dagua')}; snapshot {manifesto['versao']} mantido")
+        elif not manifesto['segmentos']:
+            # O anexo completou MAXIMO_SEGMENTOS e o snapshot foi compactado
+            print(f"Snapshot {manifesto['versao']} compactado: {manifesto['linhas']} respostas "
+                  f"em {os.path.join(args.saida, manifesto['arquivo'])}")
+        else:
+            segmento = manifesto['segmentos'][-1]
+            print(f"Snapshot {manifesto['versao']} gravado: {segmento['linhas']} respostas novas "
+                  f"em {os.path.join(args.saida, segmento['arquivo'])} ({manifesto['linhas']} no total)")
+        return
+    print(f"Snapshot {manifesto['versao']} gravado: {manifesto['linhas']} respostas "
+          f"em {os.path.join(args.saida, manifesto['arquivo'])}")
+
+
+if __name__ == '__main__':
+    main()
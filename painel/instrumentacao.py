@@ -0,0 +1,232 @@
+# Instrumentação das reexecuções: mede cada etapa do caminho de uma página (senha,
+# carga, cada filtro da barra lateral, contagem, figura e serialização de cada gráfico)
+# e mostra um gráfico de chamas com a quantidade de linhas em cada etapa. Usada antes
+# da senha, por isso pandas e Plotly só são importados ao exibir o painel.
+#
+# O painel fica desligado por padrão. Para ligar, em .streamlit/secrets.toml:
+#   instrumentacao = true
+#   admin_password = "..."
+# e entre com a senha de administrador; os demais usuários não veem o painel.
+#
+# Além disso, cada página exibida grava uma linha JSON em logs/desempenho.jsonl (com
+# rotação por tamanho) para análise posterior; `log_desempenho = false` desliga e a
+# variável de ambiente COFECI_LOG_DESEMPENHO escolhe outro arquivo (ex.: fora do diretório
+# do app, quando ele é somente leitura). Se o arquivo não puder ser aberto ou gravado, o
+# log fica desligado até o processo reiniciar, sem afetar as páginas. A rotação não
+# funciona com vários processos no mesmo arquivo: no modo de vários processos do servidor
+# (COFECI_MEMORIA_COMPARTILHADA=1) cada processo acrescenta o pid ao nome do arquivo.
+import hashlib
+import json
+import logging
+import os
+import time
+from collections import Counter
+from contextlib import contextmanager
+from datetime import datetime
+from logging.handlers import RotatingFileHandler
+
+import streamlit as st
+
+from painel import RAIZ
+
+# Chave da sessão com a medição da reexecução atual
+CHAVE_MEDICAO = '_medicao'
+
+# Log de desempenho: uma linha JSON por página exibida, com rotação por tamanho
+ARQUIVO_LOG = os.environ.get('COFECI_LOG_DESEMPENHO', os.path.join(RAIZ, 'logs', 'desempenho.jsonl'))
+# Mesma variável de painel.dados.MEMORIA_COMPARTILHADA, lida aqui para não importar os
+# módulos de dados antes da senha
+if os.environ.get('COFECI_MEMORIA_COMPARTILHADA', '') == '1':
+    _nome_log, _extensao_log = os.path.splitext(ARQUIVO_LOG)
+    ARQUIVO_LOG = f'{_nome_log}-{os.getpid()}{_extensao_log}'
+
+TAMANHO_MAXIMO_LOG = 10 * 1024 * 1024
+COPIAS_LOG = 5
+
+# Verdadeiro depois de uma falha ao abrir ou gravar o log (ver registrar_medicao)
+_log_indisponivel = False
+
+# Cores das etapas por nível de aninhamento no gráfico de chamas
+CORES_NIVEIS = ['#19407E', '#1dbde6', '#11cc99', '#f1a14e', '#f1515e']
+
+
+# Etapa medida: início e fim em segundos desde o começo da reexecução
+class Etapa:
+    def __init__(self, nome, inicio, nivel, linhas=None):
+        self.nome = nome
+        self.inicio = inicio
+        self.fim = None
+        self.nivel = nivel
+        self.linhas = linhas
+
+    @property
+    def duracao(self):
+        return self.fim - self.inicio
+
+
+# Medição de uma reexecução: lista das etapas na ordem em que começaram e contadores
+# livres (acertos de cache, bytes das figuras)
+class Medicao:
+    def __init__(self, pagina=None, exibir=False):
+        self.pagina = pagina
+        self.exibir = exibir
+        self.inicio = time.perf_counter()
+        self.etapas = []
+        self.contadores = Counter()
+        self._nivel = 0
+
+    def anotar(self, chave, valor=1):
+        self.contadores[chave] += valor
+
+    @contextmanager
+    def etapa(self, nome, linhas=None):
+        medida = Etapa(nome, time.perf_counter() - self.inicio, self._nivel, linhas)
+        self.etapas.append(medida)
+        self._nivel += 1
+        try:
+            yield medida
+        finally:
+            self._nivel -= 1
+            medida.fim = time.perf_counter() - self.inicio
+
+
+# Instrumentação ligada na configuração e sessão de administrador
+def instrumentacao_ativa():
+    return bool(st.secrets.get('instrumentacao', False)) and st.session_state.get('admin', False)
+
+
+# Log de desempenho ligado na configuração (padrão: ligado) e disponível
+def log_ativo():
+    return not _log_indisponivel and bool(st.secrets.get('log_desempenho', True))
+
+
+# Função para começar a medição da reexecução (None se o painel e o log estiverem desligados)
+def iniciar_medicao(pagina=None):
+    exibir = instrumentacao_ativa()
+    medicao = Medicao(pagina, exibir) if exibir or log_ativo() else None
+    st.session_state[CHAVE_MEDICAO] = medicao
+    return medicao
+
+
+# Medição da reexecução atual (None se desligada)
+def medicao_atual():
+    return st.session_state.get(CHAVE_MEDICAO)
+
+
+# Mede o bloco como uma etapa da reexecução atual; devolve a etapa, para anotar a
+# quantidade de linhas, ou None quando a instrumentação está desligada
+@contextmanager
+def etapa(nome, linhas=None):
+    medicao = medicao_atual()
+    if medicao is None:
+        yield None
+        return
+    with medicao.etapa(nome, linhas) as medida:
+        yield medida
+
+
+# Função para montar o gráfico de chamas: uma barra por etapa, posicionada no tempo,
+# com as etapas internas logo abaixo da etapa que as contém
+def figura_chamas(medicao):
+    import plotly.graph_objects as go
+
+    etapas = [e for e in medicao.etapas if e.fim is not None]
+    rotulos = [e.nome if e.linhas is None else f'{e.nome} ({e.linhas} linhas)' for e in etapas]
+    fig = go.Figure(go.Bar(
+        y=[e.nivel for e in etapas],
+        x=[e.duracao * 1000 for e in etapas],
+        base=[e.inicio * 1000 for e in etapas],
+        orientation='h',
+        text=rotulos,
+        textposition='inside',
+        insidetextanchor='start',
+        hovertext=[f'{r}<br>{e.duracao * 1000:.2f} ms' for r, e in zip(rotulos, etapas)],
+        hoverinfo='text',
+        marker=dict(color=[CORES_NIVEIS[e.nivel % len(CORES_NIVEIS)] for e in etapas],
+                    line=dict(color='#FFFFFF', width=1)),
+    ))
+    fig.update_layout(title='Tempo de cada etapa desta execução', xaxis_title='ms desde o início',
+                      yaxis=dict(autorange='reversed', tickmode='array', tickvals=[], title=''),
+                      bargap=0.05, uniformtext_minsize=8, uniformtext_mode='hide',
+                      height=120 + 40 * (max((e.nivel for e in etapas), default=0) + 1))
+    return fig
+
+
+# Função para exibir o painel de instrumentação ao final da página
+def exibir_medicao(medicao, metricas=None):
+    import pandas as pd
+
+    with st.expander('Instrumentação desta execução'):
+        st.plotly_chart(figura_chamas(medicao), use_container_width=True)
+        st.dataframe(pd.DataFrame({
+            'etapa': ['    ' * e.nivel + e.nome for e in medicao.etapas],
+            'início (ms)': [e.inicio * 1000 for e in medicao.etapas],
+            'duração (ms)': [e.duracao * 1000 if e.fim is not None else None for e in medicao.etapas],
+            'linhas': [e.linhas for e in medicao.etapas],
+        }), use_container_width=True, hide_index=True)
+        if metricas is not None:
+            st.write('Caches compartilhados entre as sessões')
+            st.dataframe(pd.DataFrame(metricas).T, use_container_width=True)
+
+
+# Arquivo do log com rotação; falhas de gravação sobem para registrar_medicao em vez de
+# só serem impressas pelo logging
+class _ArquivoLog(RotatingFileHandler):
+    def handleError(self, record):
+        raise
+
+
+# Logger do arquivo de desempenho, criado uma vez por processo; o handler serializa as
+# gravações das sessões (threads), mas não deve ser compartilhado entre processos (ver
+# ARQUIVO_LOG)
+@st.cache_resource
+def _log_desempenho():
+    os.makedirs(os.path.dirname(ARQUIVO_LOG), exist_ok=True)
+    logger = logging.getLogger('painel.desempenho')
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+    if not logger.handlers:
+        handler = _ArquivoLog(ARQUIVO_LOG, maxBytes=TAMANHO_MAXIMO_LOG, backupCount=COPIAS_LOG, encoding='utf-8')
+        handler.setFormatter(logging.Formatter('%(message)s'))
+        logger.addHandler(handler)
+    return logger
+
+
+# Registro de uma página exibida: página, filtros (e uma assinatura curta deles), linhas
+# após cada filtro, duração de cada etapa, acertos de cache e bytes das figuras
+def registro_medicao(medicao, filtros):
+    caminho = []
+    etapas = []
+    for e in medicao.etapas:
+        del caminho[e.nivel:]
+        caminho.append(e.nome)
+        etapas.append({
+            'etapa': ' > '.join(caminho),
+            'ms': round(e.duracao * 1000, 3) if e.fim is not None else None,
+            'linhas': e.linhas,
+        })
+    assinatura = json.dumps(filtros, sort_keys=True, ensure_ascii=False, default=list)
+    return {
+        'momento': datetime.now().isoformat(timespec='milliseconds'),
+        'pagina': medicao.pagina,
+        'filtros': filtros,
+        'assinatura_filtros': hashlib.sha256(assinatura.encode()).hexdigest()[:16],
+        'linhas_filtros': {e.nome: e.linhas for e in medicao.etapas
+                           if e.nome.startswith('filtro: ') or e.nome == 'recorte'},
+        'total_ms': round((time.perf_counter() - medicao.inicio) * 1000, 3),
+        'etapas': etapas,
+        'contadores': dict(medicao.contadores),
+    }
+
+
+# Função para gravar a medição da página no log de desempenho; diretório somente leitura
+# ou disco cheio desligam o log em vez de derrubar a página
+def registrar_medicao(medicao, filtros):
+    global _log_indisponivel
+    if not log_ativo():
+        return
+    try:
+        _log_desempenho().info(json.dumps(registro_medicao(medicao, filtros), ensure_ascii=False))
+    except OSError:
+        _log_indisponivel = True
+        logging.getLogger(__name__).exception('Log de desempenho desligado: falha ao gravar em %s', ARQUIVO_LOG)
@@ -0,0 +1,107 @@
+from collections import Counter
+
+import numpy as np
+
+from painel.dados import MEMORIA_COMPARTILHADA, cache_versao, ler_multipla, manifesto_dados, versao_dados
+
+
+# Matriz esparsa respondente x opção de uma pergunta de múltipla escolha, guardada
+# como pares (linha, código da opção). Contar quem escolheu cada opção entre as
+# linhas filtradas é um bincount, sem separar textos a cada renderização.
+class IncidenciaMultipla:
+    def __init__(self, opcoes, linhas, codigos, total_linhas):
+        self.opcoes = list(opcoes)
+        self.linhas = linhas
+        self.codigos = codigos
+        self.total_linhas = total_linhas
+        self._mapas = {}
+
+    # Máscara booleana a partir das posições das linhas selecionadas
+    # (o índice dos DataFrames da pesquisa é a posição da linha no snapshot);
+    # uma máscara já pronta é usada como está
+    def _mascara(self, posicoes):
+        posicoes = np.asarray(posicoes)
+        if posicoes.dtype == bool and len(posicoes) == self.total_linhas:
+            return posicoes
+        mascara = np.zeros(self.total_linhas, dtype=bool)
+        mascara[posicoes] = True
+        return mascara
+
+    # Para cada opção, sua posição na lista de categorias (-1 se não estiver na lista)
+    def _mapa(self, categorias):
+        chave = tuple(categorias)
+        if chave not in self._mapas:
+            posicao = {categoria: i for i, categoria in enumerate(categorias)}
+            self._mapas[chave] = np.array([posicao.get(opcao, -1) for opcao in self.opcoes], dtype=np.int32)
+        return self._mapas[chave]
+
+    # Contagem por categoria da lista; quem respondeu mas não marcou nenhuma
+    # categoria da lista entra em `outros`. Com `pesos` (um peso por linha da
+    # pesquisa) cada respondente conta pelo seu peso.
+    def contar_categorias(self, posicoes, categorias, outros='Outros', pesos=None):
+        escolhidas = self._mascara(posicoes)[self.linhas]
+        linhas = self.linhas[escolhidas]
+        categoria = self._mapa(categorias)[self.codigos[escolhidas]]
+
+        na_lista = categoria >= 0
+        contagem = np.bincount(categoria[na_lista], minlength=len(categorias),
+                               weights=None if pesos is None else pesos[linhas[na_lista]])
+
+        respondeu = np.zeros(self.total_linhas, dtype=bool)
+        respondeu[linhas] = True
+        respondeu[linhas[na_lista]] = False
+
+        tipo = int if pesos is None else float
+        contador = Counter({c: tipo(n) for c, n in zip(categorias, contagem) if n})
+        if respondeu.any():
+            contador[outros] = int(respondeu.sum()) if pesos is None else float(pesos[respondeu].sum())
+        return contador
+
+    # Escolhas das linhas selecionadas como pares (linha, posição da categoria na lista);
+    # quem só marcou opções fora da lista aparece uma vez, na posição len(categorias)
+    def escolhas_categorias(self, posicoes, categorias):
+        escolhidas = self._mascara(posicoes)[self.linhas]
+        linhas = self.linhas[escolhidas]
+        categoria = self._mapa(categorias)[self.codigos[escolhidas]]
+
+        na_lista = categoria >= 0
+        fora = np.setdiff1d(linhas[~na_lista], linhas[na_lista])
+        return (np.concatenate([linhas[na_lista], fora]),
+                np.concatenate([categoria[na_lista], np.full(len(fora), len(categorias), dtype=np.int32)]))
+
+
+# Função para montar as incidências a partir das respostas separadas (pergunta, linha, opção)
+def montar_incidencias(longo, total_linhas):
+    incidencias = {}
+    for pergunta, grupo in longo.groupby('pergunta', observed=True):
+        opcao = grupo['opcao'].cat.remove_unused_categories()
+        incidencias[pergunta] = IncidenciaMultipla(
+            opcao.cat.categories,
+            grupo['linha'].to_numpy(),
+            opcao.cat.codes.to_numpy().astype(np.int32),
+            total_linhas,
+        )
+    return incidencias
+
+
+# Incidências de todas as perguntas de múltipla escolha, montadas uma vez por versão dos
+# dados (no modo de memória compartilhada, lidas do arquivo mapeado)
+@cache_versao
+def _carregar_incidencias(versao):
+    total_linhas = manifesto_dados()['linhas']
+    if MEMORIA_COMPARTILHADA:
+        from painel.compartilhado import incidencias_compartilhadas
+        return {
+            pergunta: IncidenciaMultipla(opcoes, linhas, codigos, total_linhas)
+            for pergunta, (opcoes, linhas, codigos) in incidencias_compartilhadas(manifesto_dados()).items()
+        }
+    return montar_incidencias(ler_multipla(manifesto_dados()), total_linhas)
+
+
+# Incidências de todas as perguntas de múltipla escolha da versão atual dos dados
+def incidencias_multiplas():
+    return _carregar_incidencias(versao_dados())
+
+
+def respostas_multiplas(pergunta):
+    return incidencias_multiplas()[pergunta]
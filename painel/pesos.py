@@ -0,0 +1,108 @@
+# Pesos amostrais por raking (ajuste proporcional iterativo): a amostra da pesquisa é
+# muito desigual entre estados, sexos e faixas de idade, então cada respondente recebe
+# um peso para que os totais ponderados batam com os totais do cadastro do COFECI.
+#
+# O ajuste é feito sobre as células do cubo de contagens (estado x capital x idade x
+# escolaridade x sexo): todos os respondentes de uma célula têm o mesmo peso, e uma
+# contagem ponderada custa o mesmo bincount da contagem simples. Os pesos são calculados
+# uma vez por versão dos dados e do arquivo de metas.
+#
+# As metas ficam em metas_pesos.json, na raiz do projeto (ver metas_pesos.exemplo.json):
+#   {"margens": {"estado": {"São Paulo (SP)": 180000, ...},
+#                "sexo": {"Masculino": 390000, "Feminino": 210000},
+#                "idade": {"Menos de 35 anos": 90000, "Mais de 35 anos": 500000, "35 anos": 10000}}}
+# Cada margem usa uma dimensão do cubo (painel.filtros.DIMENSOES_CUBO) e os mesmos rótulos
+# dos filtros. Valores sem meta (ou sem resposta) ficam com o fator 1 naquela margem.
+import hashlib
+import json
+import os
+
+import numpy as np
+
+from painel import RAIZ
+from painel.cubo import cubo_respostas
+from painel.dados import cache_versao, carregar_pesquisa, versao_dados
+from painel.filtros import COLUNAS_INDICE, DIMENSOES_CUBO
+
+# Arquivo com os totais do cadastro usados como metas
+ARQUIVO_METAS = os.path.join(RAIZ, 'metas_pesos.json')
+
+# Critério de parada do raking: maior ajuste relativo de uma rodada
+MAXIMO_ITERACOES = 100
+TOLERANCIA = 1e-6
+
+
+# Pesos ajustados: um por célula do cubo e um por linha da pesquisa. Os pesos ficam na
+# escala da amostra (média perto de 1), pois só os percentuais importam.
+class PesosAmostrais:
+    def __init__(self, por_celula, por_linha, iteracoes, convergiu, assinatura):
+        por_celula.setflags(write=False)
+        por_linha.setflags(write=False)
+        self.por_celula = por_celula
+        self.por_linha = por_linha
+        self.iteracoes = iteracoes
+        self.convergiu = convergiu
+        # Hash do arquivo de metas, usado nas chaves de cache
+        self.assinatura = assinatura
+
+    # Efeito do desenho de Kish: quanto a ponderação reduz o tamanho efetivo da amostra
+    @property
+    def efeito_desenho(self):
+        return float(len(self.por_linha) * (self.por_linha ** 2).sum() / self.por_linha.sum() ** 2)
+
+
+# Função para ajustar os pesos das células às margens por raking. `respondentes` é a
+# matriz de contagens do cubo; `rotulos` traz os rótulos de cada dimensão.
+def ajustar_pesos(respondentes, rotulos, margens):
+    forma = respondentes.shape
+    metas = []
+    for dimensao, totais in margens.items():
+        eixo = DIMENSOES_CUBO.index(dimensao)
+        meta = np.full(forma[eixo], np.nan)
+        for valor, total in totais.items():
+            if valor in rotulos[dimensao]:
+                meta[rotulos[dimensao].index(valor)] = total
+        # Metas como proporções; a cada rodada são aplicadas ao total ponderado atual dos
+        # valores cobertos, então quem não tem meta não muda a escala dos demais
+        amostra = respondentes.sum(axis=tuple(i for i in range(len(forma)) if i != eixo))
+        cobertas = ~np.isnan(meta) & (amostra > 0)
+        meta[~cobertas] = np.nan
+        meta[cobertas] /= meta[cobertas].sum()
+        metas.append((eixo, meta, cobertas))
+
+    pesos = np.ones(forma)
+    for iteracao in range(1, MAXIMO_ITERACOES + 1):
+        variacao = 0.0
+        for eixo, meta, cobertas in metas:
+            outros = tuple(i for i in range(len(forma)) if i != eixo)
+            atual = (respondentes * pesos).sum(axis=outros)
+            fator = np.ones(forma[eixo])
+            fator[cobertas] = meta[cobertas] * atual[cobertas].sum() / atual[cobertas]
+            variacao = max(variacao, float(np.abs(fator - 1).max()))
+            pesos *= fator.reshape([-1 if i == eixo else 1 for i in range(len(forma))])
+        if variacao < TOLERANCIA:
+            return pesos, iteracao, True
+    return pesos, MAXIMO_ITERACOES, False
+
+
+# Pesos calculados uma vez por versão dos dados e do arquivo de metas
+@cache_versao
+def _calcular_pesos(versao, modificado_em):
+    with open(ARQUIVO_METAS, 'rb') as arquivo:
+        conteudo = arquivo.read()
+    margens = json.loads(conteudo)['margens']
+
+    cubo = cubo_respostas()
+    respondentes = cubo.respondentes.reshape(cubo.forma)
+    pesos, iteracoes, convergiu = ajustar_pesos(respondentes, cubo.rotulos, margens)
+    por_celula = pesos.ravel()
+    por_linha = por_celula[cubo.celulas_das_linhas(carregar_pesquisa(COLUNAS_INDICE))]
+    return PesosAmostrais(por_celula, por_linha, iteracoes, convergiu,
+                          hashlib.sha256(conteudo).hexdigest()[:12])
+
+
+# Pesos amostrais da versão atual dos dados (None se não houver arquivo de metas)
+def pesos_amostrais():
+    if not os.path.exists(ARQUIVO_METAS):
+        return None
+    return _calcular_pesos(versao_dados(), os.stat(ARQUIVO_METAS).st_mtime_ns)
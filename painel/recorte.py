@@ -0,0 +1,72 @@
+import numpy as np
+import pandas as pd
+
+
+# Recorte filtrado da pesquisa, somente leitura: guarda as posições das linhas
+# selecionadas sobre o DataFrame compartilhado em vez de materializar um novo
+# DataFrame. Cada coluna lida é uma cópia pequena só com as linhas do recorte,
+# então o código dos gráficos não tem como alterar (nem copiar inteira) a pesquisa.
+class Recorte:
+    def __init__(self, pesquisa, linhas, celulas=None, pesos=None):
+        linhas = np.array(linhas, dtype=np.int64)
+        linhas.setflags(write=False)
+        if celulas is not None:
+            celulas = np.array(celulas, dtype=bool)
+            celulas.setflags(write=False)
+        self._pesquisa = pesquisa
+        self._mascara = None
+        # Posições das linhas no snapshot (o índice da pesquisa é a posição da linha)
+        self.linhas = linhas
+        # Células do cubo de contagens que correspondem ao recorte (None se não houver)
+        self.celulas = celulas
+        # Pesos amostrais (painel.pesos) quando os percentuais são ponderados
+        self.pesos = pesos
+
+    # Recorte a partir de uma máscara booleana sobre todas as linhas da pesquisa
+    @classmethod
+    def da_mascara(cls, pesquisa, mascara, celulas=None, pesos=None):
+        return cls(pesquisa, np.flatnonzero(mascara), celulas, pesos)
+
+    def __len__(self):
+        return len(self.linhas)
+
+    @property
+    def total_linhas(self):
+        return len(self._pesquisa)
+
+    # Tamanho do recorte: quantidade de linhas ou, se ponderado, a soma dos pesos
+    def peso_total(self):
+        if self.pesos is None:
+            return len(self)
+        return float(self.pesos.por_linha[self.linhas].sum())
+
+    # Efeito do desenho de Kish no recorte (1 sem pesos): dividir uma contagem ponderada
+    # por ele dá o tamanho efetivo da amostra, usado nos intervalos de confiança
+    def efeito_desenho(self):
+        if self.pesos is None or not len(self):
+            return 1.0
+        pesos = self.pesos.por_linha[self.linhas]
+        return float(len(pesos) * (pesos ** 2).sum() / pesos.sum() ** 2)
+
+    # Valores da coluna nas linhas do recorte (Series nova, indexada pela posição da linha)
+    def coluna(self, nome):
+        return self._pesquisa[nome].take(self.linhas)
+
+    # Códigos das respostas da coluna na ordem de `categorias` (-1 para as demais e para nulos)
+    def codigos(self, nome, categorias):
+        serie = self._pesquisa[nome]
+        if isinstance(serie.dtype, pd.CategoricalDtype):
+            # Traduz só os códigos da categoria, sem decodificar as linhas em texto
+            traducao = pd.Index(categorias).get_indexer(serie.cat.categories.astype(object))
+            codigos = serie.cat.codes.to_numpy()[self.linhas]
+            return np.where(codigos >= 0, traducao[codigos], -1)
+        return pd.Categorical(self.coluna(nome), categories=categorias).codes
+
+    # Máscara booleana das linhas do recorte sobre todas as linhas da pesquisa
+    def mascara(self):
+        if self._mascara is None:
+            mascara = np.zeros(self.total_linhas, dtype=bool)
+            mascara[self.linhas] = True
+            mascara.setflags(write=False)
+            self._mascara = mascara
+        return self._mascara
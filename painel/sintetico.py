@@ -0,0 +1,197 @@
+# Gerador de respondentes sintéticos para testar o painel em escala nacional.
+# Aprende com a pesquisa real a distribuição de cada coluna PERG.* e as dependências
+# entre pares de colunas (árvore de Chow-Liu: cada coluna é sorteada condicionada à
+# coluna de que mais depende) e grava uma base do tamanho pedido no mesmo formato da
+# exportação em CSV, pronta para `python -m painel.ingestao`.
+#
+# Nenhum dado pessoal real é copiado: nomes viram identificadores genéricos e respostas
+# livres raras (que poderiam identificar alguém) viram textos genéricos.
+#
+# Uso:
+#   python -m painel.sintetico 100k --saida sintetico/cofeci-100k.csv
+#   python -m painel.ingestao sintetico/cofeci-100k.csv --saida sintetico/snapshots-100k
+#   COFECI_SNAPSHOTS=sintetico/snapshots-100k python -m painel.benchmark --origem sintetico/cofeci-100k.csv
+import argparse
+import os
+import re
+
+import numpy as np
+import pandas as pd
+
+from painel import dados
+from painel.ingestao import ler_origem
+
+# Colunas de identificação, substituídas por identificadores genéricos
+COLUNA_DATA = 'PERG.1'
+COLUNA_ENTREVISTADOR = 'PERG.3'
+COLUNA_NOME = 'PERG.4'
+
+# Respostas que aparecem menos vezes que isso na base real são tratadas como texto
+# livre identificável e trocadas por um texto genérico (números e idades são mantidos)
+MINIMO_OCORRENCIAS = 5
+
+NUMERICO = re.compile(r'^\s*\d+([.,]\d+)?\s*(anos)?\s*$', re.IGNORECASE)
+
+# Tamanhos usados nos testes de escala
+TAMANHOS = {'10k': 10_000, '100k': 100_000, '1M': 1_000_000}
+
+
+# Função para trocar as respostas raras da coluna por textos genéricos; nas perguntas de
+# múltipla escolha a troca é feita opção por opção
+def anonimizar(serie, multipla=False):
+    if multipla:
+        opcoes = serie.dropna().astype(str).str.split(',').explode().str.strip()
+    else:
+        opcoes = serie.dropna()
+    frequencia = opcoes.value_counts()
+    raras = [valor for valor, n in frequencia.items()
+             if n < MINIMO_OCORRENCIAS and not NUMERICO.match(str(valor))]
+    if not raras:
+        return serie
+    genericos = {valor: f'Resposta livre {i + 1}' for i, valor in enumerate(raras)}
+
+    if not multipla:
+        return serie.map(lambda valor: genericos.get(valor, valor), na_action='ignore')
+    return serie.map(lambda texto: ', '.join(
+        genericos.get(opcao.strip(), opcao.strip()) for opcao in str(texto).split(',')
+        if opcao.strip()
+    ), na_action='ignore')
+
+
+# Informação mútua entre duas colunas já codificadas (códigos de 0 a n-1)
+def _informacao_mutua(a, na, b, nb):
+    conjunta = np.bincount(a * nb + b, minlength=na * nb).reshape(na, nb) / len(a)
+    pa = conjunta.sum(axis=1, keepdims=True)
+    pb = conjunta.sum(axis=0, keepdims=True)
+    com = conjunta > 0
+    return float((conjunta[com] * np.log(conjunta[com] / (pa @ pb)[com])).sum())
+
+
+# Modelo aprendido da base real: categorias de cada coluna, árvore de dependências
+# e tabelas de probabilidade condicional coluna | coluna pai
+class ModeloSintetico:
+    def __init__(self, df):
+        self.colunas = list(df.columns)
+        self.datas = pd.to_datetime(df[COLUNA_DATA], errors='coerce').dropna()
+        self.formato_data = len(str(df[COLUNA_DATA].dropna().iloc[0]))
+
+        codigos = {}
+        self.categorias = {}
+        for coluna in self.colunas:
+            if coluna in (COLUNA_DATA, COLUNA_NOME):
+                continue
+            serie = df[coluna]
+            if coluna == COLUNA_ENTREVISTADOR:
+                nomes = {nome: f'Entrevistador {i + 1}' for i, nome in enumerate(serie.dropna().unique())}
+                serie = serie.map(nomes)
+            else:
+                serie = anonimizar(serie, multipla=coluna in dados.PERGUNTAS_MULTIPLA)
+            # Resposta em branco é uma categoria como as outras
+            codigos[coluna], self.categorias[coluna] = pd.factorize(serie, use_na_sentinel=False)
+
+        self.pais, self.ordem = self._arvore(codigos)
+        self.tabelas = {}
+        for coluna in self.ordem:
+            n = len(self.categorias[coluna])
+            pai = self.pais[coluna]
+            if pai is None:
+                tabela = np.bincount(codigos[coluna], minlength=n)[None, :]
+            else:
+                npai = len(self.categorias[pai])
+                tabela = np.bincount(codigos[pai] * n + codigos[coluna],
+                                     minlength=npai * n).reshape(npai, n)
+            # Probabilidades acumuladas por linha, para sortear com searchsorted
+            self.tabelas[coluna] = np.cumsum(tabela / tabela.sum(axis=1, keepdims=True), axis=1)
+
+    # Árvore geradora de máxima informação mútua (Prim), a partir da coluna de estado
+    def _arvore(self, codigos):
+        colunas = list(codigos)
+        tamanhos = [len(self.categorias[c]) for c in colunas]
+        n = len(colunas)
+        pesos = np.zeros((n, n))
+        for i in range(n):
+            for j in range(i + 1, n):
+                pesos[i, j] = pesos[j, i] = _informacao_mutua(
+                    codigos[colunas[i]], tamanhos[i], codigos[colunas[j]], tamanhos[j])
+
+        raiz = colunas.index('PERG.6') if 'PERG.6' in colunas else 0
+        pais = {colunas[raiz]: None}
+        ordem = [colunas[raiz]]
+        melhor = pesos[raiz].copy()
+        origem = np.full(n, raiz)
+        fora = np.ones(n, dtype=bool)
+        fora[raiz] = False
+        while fora.any():
+            proxima = int(np.flatnonzero(fora)[np.argmax(melhor[fora])])
+            pais[colunas[proxima]] = colunas[origem[proxima]]
+            ordem.append(colunas[proxima])
+            fora[proxima] = False
+            maior = pesos[proxima] > melhor
+            melhor[maior] = pesos[proxima][maior]
+            origem[maior] = proxima
+        return pais, ordem
+
+    # Função para gerar `linhas` respondentes com as colunas na ordem da base real
+    def gerar(self, linhas, semente=None):
+        rng = np.random.default_rng(semente)
+        codigos = {}
+        for coluna in self.ordem:
+            tabela = self.tabelas[coluna]
+            pai = self.pais[coluna]
+            sorteio = rng.random(linhas)
+            codigo = np.empty(linhas, dtype=np.int32)
+            if pai is None:
+                codigo[:] = np.searchsorted(tabela[0], sorteio, side='right')
+            else:
+                # Linhas agrupadas pelo valor da coluna pai, sorteadas grupo a grupo
+                grupos = np.argsort(codigos[pai], kind='stable')
+                limites = np.cumsum(np.bincount(codigos[pai], minlength=tabela.shape[0]))
+                for valor, (inicio, fim) in enumerate(zip(np.r_[0, limites[:-1]], limites)):
+                    linhas_valor = grupos[inicio:fim]
+                    codigo[linhas_valor] = np.searchsorted(tabela[valor], sorteio[linhas_valor], side='right')
+            # Protege contra o arredondamento da última probabilidade acumulada
+            codigos[coluna] = np.minimum(codigo, tabela.shape[1] - 1)
+
+        df = {}
+        for coluna in self.colunas:
+            if coluna == COLUNA_DATA:
+                df[coluna] = self._datas(linhas, rng)
+            elif coluna == COLUNA_NOME:
+                df[coluna] = [f'Respondente {i + 1:07d}' for i in range(linhas)]
+            else:
+                df[coluna] = np.asarray(self.categorias[coluna], dtype=object)[codigos[coluna]]
+        return pd.DataFrame(df, columns=self.colunas)
+
+    # Datas de resposta sorteadas entre a primeira e a última da base real
+    def _datas(self, linhas, rng):
+        inicio, fim = self.datas.min().value, self.datas.max().value
+        datas = pd.to_datetime(rng.integers(inicio, fim, size=linhas, endpoint=True)).floor('ms')
+        return datas.strftime('%Y-%m-%d %H:%M:%S.%f').str[:self.formato_data]
+
+
+def _tamanho(texto):
+    if texto in TAMANHOS:
+        return TAMANHOS[texto]
+    return int(texto)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Gera uma base sintética no formato da pesquisa COFECI.')
+    parser.add_argument('linhas', type=_tamanho,
+                        help='quantidade de respondentes (número ou ' + ', '.join(TAMANHOS) + ')')
+    parser.add_argument('--origem', default=dados.ARQUIVO_CSV,
+                        help='planilha .xlsx ou exportação .csv usada como modelo (padrão: cofeci.csv)')
+    parser.add_argument('--saida', help='arquivo CSV gerado (padrão: sintetico/cofeci-<linhas>.csv)')
+    parser.add_argument('--semente', type=int, help='semente do sorteio, para repetir a mesma base')
+    args = parser.parse_args(argv)
+
+    saida = args.saida or os.path.join(dados.RAIZ, 'sintetico', f'cofeci-{args.linhas}.csv')
+    os.makedirs(os.path.dirname(os.path.abspath(saida)), exist_ok=True)
+
+    modelo = ModeloSintetico(ler_origem(args.origem))
+    modelo.gerar(args.linhas, args.semente).to_csv(saida, index=False)
+    print(f'{args.linhas} respondentes sintéticos gravados em {saida}')
+
+
+if __name__ == '__main__':
+    main()